@@ -23,47 +23,113 @@ import textwrap, math, os.path, re, json
 from random import randint
 
 # Forward all messages through a queue (polled by background thread)
+# Records are collected into small batches so that bursts of tracing cost one queue hand-off per batch.
+# on_partial_batch is called when a new batch is started so the owner can arrange for it to be flushed
 class QueueHandler(logging.Handler):
-    def __init__(self, queue):
+    BATCH_SIZE = 32
+    MAX_QUEUED_BATCHES = 10000 // BATCH_SIZE # Roughly 10000 records
+
+    def __init__(self, queue, on_partial_batch=None):
         logging.Handler.__init__(self)
         self.queue = queue
+        self.on_partial_batch = on_partial_batch
+        self.batch = []
+        self.batch_lock = threading.Lock()
+        self.dropped = 0
 
     def emit(self, record):
         try:
-            self.format(record)
-            record.msg = record.message
+            record.msg = record.getMessage() # Formatting proper is done by the listener
             record.args = None
             record.exc_info = None
-            self.queue.put_nowait(record)
+            record.exc_text = None
+            with self.batch_lock:
+                self.batch.append(record)
+                if len(self.batch) < self.BATCH_SIZE and record.levelno < logging.WARNING:
+                    if len(self.batch) == 1 and self.on_partial_batch is not None:
+                        self.on_partial_batch()
+                    return
+                self._enqueue_batch()
         except Exception:
             self.handleError(record)
 
+    # Push any partial batch to the background thread
+    def flush(self):
+        with self.batch_lock:
+            if self.batch:
+                self._enqueue_batch()
+
+    # Must be called with batch_lock held. If the background thread has fallen too far behind
+    # records below WARNING are shed (and later reported) rather than letting the queue grow unbounded
+    def _enqueue_batch(self):
+        batch, self.batch = self.batch, []
+        if self.queue.qsize() >= self.MAX_QUEUED_BATCHES:
+            kept = [r for r in batch if r.levelno >= logging.WARNING]
+            self.dropped += len(batch) - len(kept)
+            if not kept:
+                return
+            batch = kept
+        if self.dropped:
+            batch.insert(0, logging.makeLogRecord({
+                'name': 'ercf', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': "%d log records dropped because logfile writing fell behind" % self.dropped}))
+            self.dropped = 0
+        self.queue.put_nowait(batch)
+
 # Poll log queue on background thread and log each message to logfile
+# The logfile is written through a large buffer and only flushed when the queue drains
 class QueueListener(logging.handlers.TimedRotatingFileHandler):
+    BUFFER_SIZE = 65536
+    STOP_TIMEOUT = 0.5
+
     def __init__(self, filename):
         logging.handlers.TimedRotatingFileHandler.__init__(
             self, filename, when='midnight', backupCount=5)
-        self.bg_queue = queue.Queue()
-        self.bg_thread = threading.Thread(target=self._bg_thread)
+        self.bg_queue = queue.SimpleQueue()
+        self.bg_thread = threading.Thread(target=self._bg_thread, daemon=True)
         self.bg_thread.start()
 
+    def _open(self):
+        # 'errors' was only added to FileHandler in Python 3.9
+        return open(self.baseFilename, self.mode, buffering=self.BUFFER_SIZE, encoding=self.encoding,
+                    errors=getattr(self, 'errors', None))
+
+    # Called by emit() after every record. Skipped, the background thread flushes instead
+    def flush(self):
+        pass
+
+    def _flush_stream(self):
+        logging.handlers.TimedRotatingFileHandler.flush(self)
+
+    # Block for the next batch then drain everything already queued before flushing once
     def _bg_thread(self):
+        bg_queue = self.bg_queue
         while True:
-            record = self.bg_queue.get(True)
-            if record is None:
+            batch = bg_queue.get(True)
+            try:
+                while batch is not None:
+                    for record in batch:
+                        self.handle(record)
+                    batch = bg_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._flush_stream()
+            if batch is None:
                 break
-            self.handle(record)
 
     def stop(self):
         self.bg_queue.put_nowait(None)
-        self.bg_thread.join()
+        self.bg_thread.join(timeout=self.STOP_TIMEOUT) # Daemon thread so never hold up Klippy shutdown
 
 # Class to improve formatting of multi-line ERCF messages
 class MultiLineFormatter(logging.Formatter):
+    INDENTED_NEWLINE = '\n' + ' ' * 9
+
     def format(self, record):
-        indent = ' ' * 9
         lines = super(MultiLineFormatter, self).format(record)
-        return lines.replace('\n', '\n' + indent)
+        if record.exc_info is None and record.stack_info is None and '\n' not in record.message:
+            return lines # Common single line case
+        return lines.replace('\n', self.INDENTED_NEWLINE)
 
 # Ercf exception error class
 class ErcfError(Exception):
@@ -72,6 +138,7 @@ class ErcfError(Exception):
 # Main ERCF klipper module
 class Ercf:
     BOOT_DELAY = 1.5            # Delay before running bootup tasks
+    LOG_FLUSH_INTERVAL = 0.05   # Maximum time a partial batch of log records waits before going to the log thread
 
     LONG_MOVE_THRESHOLD = 85.   # This is also the initial move to load past encoder
     ENCODER_MIN = 1.0           # The threshold (mm) that determines real encoder movement (ignore erroneous pulse)
@@ -98,6 +165,11 @@ class Ercf:
     LOADED_STATUS_PARTIAL_IN_EXTRUDER = 7
     LOADED_STATUS_FULL = 8
 
+    # Groups of loaded states used in state checks
+    NOT_LOADED_STATES = frozenset([LOADED_STATUS_UNLOADED, LOADED_STATUS_UNKNOWN])
+    IN_BOWDEN_STATES = frozenset([LOADED_STATUS_PARTIAL_PAST_ENCODER, LOADED_STATUS_PARTIAL_IN_BOWDEN])
+    PERSISTED_LOADED_STATES = frozenset([LOADED_STATUS_FULL, LOADED_STATUS_UNLOADED]) # Partial states are saved as unknown
+
     DIRECTION_LOAD = 1
     DIRECTION_UNLOAD = -1
 
@@ -112,6 +184,72 @@ class Ercf:
     ACTION_HOMING = 8
     ACTION_SELECTING = 9
 
+    ACTION_STRINGS = {
+        ACTION_IDLE: "Idle",
+        ACTION_LOADING: "Loading",
+        ACTION_UNLOADING: "Unloading",
+        ACTION_LOADING_EXTRUDER: "Loading Ext",
+        ACTION_UNLOADING_EXTRUDER: "Exiting Ext",
+        ACTION_FORMING_TIP: "Forming Tip",
+        ACTION_HEATING: "Heating",
+        ACTION_CHECKING: "Checking",
+        ACTION_HOMING: "Homing",
+        ACTION_SELECTING: "Selecting",
+    }
+    SERVO_STRINGS = {SERVO_UP_STATE: "Up", SERVO_DOWN_STATE: "Down"}
+    FILAMENT_STRINGS = {LOADED_STATUS_FULL: "Loaded", LOADED_STATUS_UNLOADED: "Unloaded"}
+    GATE_STATUS_STRINGS = {
+        GATE_AVAILABLE_FROM_BUFFER: "Buffered",
+        GATE_AVAILABLE: "Available",
+        GATE_EMPTY: "Empty",
+        GATE_UNKNOWN: "Unknown",
+    }
+    # Gate status characters for map displays. The no_space variant marks empty gates with '.'
+    GATE_CHARS = {GATE_AVAILABLE_FROM_BUFFER: "B", GATE_AVAILABLE: "*", GATE_EMPTY: " "}
+    GATE_CHARS_NO_SPACE = {GATE_AVAILABLE_FROM_BUFFER: "B", GATE_AVAILABLE: "*", GATE_EMPTY: "."}
+    # '#' is dropped from gate material and color names (whitespace is removed separately)
+    GATE_MAP_STRIP_CHARS = str.maketrans("", "", "#")
+    PERSISTENCE_STRINGS = {
+        1: "EndlessSpool groups",
+        2: "TTG map & EndlessSpool groups",
+        3: "Gate status & TTG map & EndlessSpool groups",
+        4: "All",
+    }
+
+    # Full and compact (log_visual: 2) filament position displays for each loaded status
+    VISUAL_TEMPLATES = {
+        LOADED_STATUS_UNKNOWN:
+            ("ERCF [T{t}] ..... [encoder] ............. [extruder] ...... [nozzle] UNKNOWN",
+             "ERCF [T{t}] ... [En] ....... [Ex] ... [Nz] UNKNOWN"),
+        LOADED_STATUS_UNLOADED:
+            ("ERCF [T{t}] >.... [encoder] ............. [extruder] ...... [nozzle] UNLOADED",
+             "ERCF [T{t}] >.. [En] ....... [Ex] ... [Nz] UNLOADED"),
+        LOADED_STATUS_PARTIAL_BEFORE_ENCODER:
+            ("ERCF [T{t}] >>>.. [encoder] ............. [extruder] ...... [nozzle]",
+             "ERCF [T{t}] >>. [En] ....... [Ex] ... [Nz]"),
+        LOADED_STATUS_PARTIAL_PAST_ENCODER:
+            ("ERCF [T{t}] >>>>> [encoder] >>........... [extruder] ...... [nozzle]",
+             "ERCF [T{t}] >>> [En] >...... [Ex] ... [Nz]"),
+        LOADED_STATUS_PARTIAL_IN_BOWDEN:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>...... [extruder] ...... [nozzle]",
+             "ERCF [T{t}] >>> [En] >>>>... [Ex] ... [Nz]"),
+        LOADED_STATUS_PARTIAL_END_OF_BOWDEN:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] ...... [nozzle]",
+             "ERCF [T{t}] >>> [En] >>>>>>> [Ex] ... [Nz]"),
+        LOADED_STATUS_PARTIAL_HOMED_EXTRUDER:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>>>>>>| [extruder] ...... [nozzle]",
+             "ERCF [T{t}] >>> [En] >>>>>>| [Ex] ... [Nz]"),
+        LOADED_STATUS_PARTIAL_HOMED_SENSOR:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>|... [nozzle]",
+             "ERCF [T{t}] >>> [En] >>>>>>> [Ex] >|.. [Nz]"),
+        LOADED_STATUS_PARTIAL_IN_EXTRUDER:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>>>.. [nozzle]",
+             "ERCF [T{t}] >>> [En] >>>>>>> [Ex] >>. [Nz]"),
+        LOADED_STATUS_FULL:
+            ("ERCF [T{t}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>>>>> [nozzle] LOADED",
+             "ERCF [T{t}] >>> [En] >>>>>>> [Ex] >>> [Nz] LOADED")
+    }
+
     # Extruder homing sensing strategies
     EXTRUDER_COLLISION = 0
     EXTRUDER_STALLGUARD = 1
@@ -134,10 +272,19 @@ class Ercf:
     VARS_ERCF_SWAP_STATISTICS        = "ercf_statistics_swaps"
     VARS_ERCF_SELECTOR_OFFSETS       = "ercf_selector_offsets"
 
+    # Per-gate lists restored at startup: (minimum persistence_level, attribute, variable)
+    PERSISTED_GATE_LISTS = [
+        (3, 'gate_status', VARS_ERCF_GATE_STATUS),
+        (3, 'gate_material', VARS_ERCF_GATE_MATERIAL),
+        (3, 'gate_color', VARS_ERCF_GATE_COLOR),
+        (2, 'tool_to_gate_map', VARS_ERCF_TOOL_TO_GATE_MAP),
+        (1, 'endless_spool_groups', VARS_ERCF_ENDLESS_SPOOL_GROUPS),
+    ]
+
     DEFAULT_ENCODER_RESOLUTION = 0.67 # 0.67 is about the resolution of one pulse
     EMPTY_GATE_STATS_ENTRY = {'pauses': 0, 'loads': 0, 'load_distance': 0.0, 'load_delta': 0.0, 'unloads': 0, 'unload_distance': 0.0, 'unload_delta': 0.0, 'servo_retries': 0, 'load_failures': 0, 'unload_failures': 0}
 
-    W3C_COLORS = ['aliceblue', 'antiquewhite', 'aqua', 'aquamarine', 'azure', 'beige', 'bisque', 'black', 'blanchedalmond', 'blue', 'blueviolet',
+    W3C_COLORS = frozenset(['aliceblue', 'antiquewhite', 'aqua', 'aquamarine', 'azure', 'beige', 'bisque', 'black', 'blanchedalmond', 'blue', 'blueviolet',
                   'brown', 'burlywood', 'cadetblue', 'chartreuse', 'chocolate', 'coral', 'cornflowerblue', 'cornsilk', 'crimson', 'cyan', 'darkblue',
                   'darkcyan', 'darkgoldenrod', 'darkgray', 'darkgreen', 'darkgrey', 'darkkhaki', 'darkmagenta', 'darkolivegreen', 'darkorange',
                   'darkorchid', 'darkred', 'darksalmon', 'darkseagreen', 'darkslateblue', 'darkslategray', 'darkslategrey', 'darkturquoise', 'darkviolet',
@@ -151,9 +298,178 @@ class Ercf:
                   'palegoldenrod', 'palegreen', 'paleturquoise', 'palevioletred', 'papayawhip', 'peachpuff', 'peru', 'pink', 'plum', 'powderblue',
                   'purple', 'rebeccapurple', 'red', 'rosybrown', 'royalblue', 'saddlebrown', 'salmon', 'sandybrown', 'seagreen', 'seashell', 'sienna',
                   'silver', 'skyblue', 'slateblue', 'slategray', 'slategrey', 'snow', 'springgreen', 'steelblue', 'tan', 'teal', 'thistle', 'tomato',
-                  'turquoise', 'violet', 'wheat', 'white', 'whitesmoke', 'yellow', 'yellowgreen']
+                  'turquoise', 'violet', 'wheat', 'white', 'whitesmoke', 'yellow', 'yellowgreen'])
 
     UPGRADE_REMINDER = "Did you upgrade? Run Happy Hare './install.sh' again to fix configuration files and/or read https://github.com/moggieuk/ERCF-Software-V3/blob/master/doc/UPGRADE.md"
+    MISSING_GEAR_STEPPER_ERROR = "Missing [manual_extruder_stepper gear_stepper] definition in ercf_hardware.cfg\n" + UPGRADE_REMINDER
+    MISSING_SERVO_ERROR = "Missing [ercf_servo] definition in ercf_hardware.cfg\n" + UPGRADE_REMINDER
+    MISSING_ENCODER_ERROR = "Missing [ercf_encoder] definition in ercf_hardware.cfg\n" + UPGRADE_REMINDER
+
+    # Simple configuration parameters read into attributes of the same name: (option, getter, default (if any), limits)
+    CONFIG_PARAMETERS = [
+        # Specific build parameters / tuning
+        ('version', 'getfloat', (1.1,), {}),
+        ('long_moves_speed', 'getfloat', (100.,), {'minval': 1.}),
+        ('short_moves_speed', 'getfloat', (25.,), {'minval': 1.}),
+        ('z_hop_height', 'getfloat', (5.,), {'minval': 0.}),
+        ('z_hop_speed', 'getfloat', (15.,), {'minval': 1.}),
+        ('gear_homing_accel', 'getfloat', (1000,), {}),
+        ('gear_sync_accel', 'getfloat', (1000,), {}),
+        ('gear_buzz_accel', 'getfloat', (2000,), {}),
+        ('servo_up_angle', 'getfloat', (), {}),
+        ('servo_down_angle', 'getfloat', (), {}),
+        ('servo_duration', 'getfloat', (0.2,), {'minval': 0.1}),
+        ('num_moves', 'getint', (1,), {'minval': 1}),
+        ('apply_bowden_correction', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('load_bowden_tolerance', 'getfloat', (10.,), {'minval': 1.}),
+        ('parking_distance', 'getfloat', (23.,), {'minval': 12., 'maxval': 130.}),
+        ('encoder_move_step_size', 'getfloat', (15.,), {'minval': 5., 'maxval': 25.}),
+        ('load_encoder_retries', 'getint', (2,), {'minval': 1, 'maxval': 5}),
+        ('timeout_pause', 'getint', (72000,), {}),
+        ('timeout_unlock', 'getint', (-1,), {}),
+        ('disable_heater', 'getint', (600,), {}),
+        ('min_temp_extruder', 'getfloat', (180.,), {}),
+        ('calibration_bowden_length', 'getfloat', (), {}),
+        ('unload_buffer', 'getfloat', (30.,), {'minval': 15.}),
+        ('home_to_extruder', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('ignore_extruder_load_error', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('extruder_homing_max', 'getfloat', (50.,), {'above': 20.}),
+        ('extruder_homing_step', 'getfloat', (2.,), {'minval': 0.5, 'maxval': 5.}),
+        ('extruder_homing_current', 'getint', (50,), {'minval': 10, 'maxval': 100}),
+        ('extruder_form_tip_current', 'getint', (100,), {'minval': 100, 'maxval': 150}),
+        ('toolhead_homing_max', 'getfloat', (20.,), {'minval': 0.}),
+        ('toolhead_homing_step', 'getfloat', (1.,), {'minval': 0.5, 'maxval': 5.}),
+        ('sync_load_length', 'getfloat', (8.,), {'minval': 0., 'maxval': 100.}), # keep?
+        ('sync_load_speed', 'getfloat', (10.,), {'minval': 1., 'maxval': 100.}),
+        ('sync_unload_length', 'getfloat', (10.,), {'minval': 0., 'maxval': 100.}), # keep?
+        ('sync_unload_speed', 'getfloat', (10.,), {'minval': 1., 'maxval': 100.}),
+        ('delay_servo_release', 'getfloat', (2.,), {'minval': 0., 'maxval': 5.}),
+        ('home_position_to_nozzle', 'getfloat', (), {'minval': 5.}), # Legacy, separate measures below are preferred
+        ('extruder_to_nozzle', 'getfloat', (0.,), {'minval': 5.}), # For sensorless
+        ('sensor_to_nozzle', 'getfloat', (0.,), {'minval': 5.}), # For toolhead sensor
+        ('nozzle_load_speed', 'getfloat', (15,), {'minval': 1., 'maxval': 100.}),
+        ('nozzle_unload_speed', 'getfloat', (20,), {'minval': 1., 'maxval': 100.}),
+        ('filamentblock_width', 'getfloat', (21.,), {}), # 21 for ERCF v1.1 default filament blocks
+
+        # Gear/Extruder synchronization controls
+        ('sync_to_extruder', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('sync_load_extruder', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('sync_unload_extruder', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('sync_form_tip', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('sync_gear_current', 'getint', (50,), {'minval': 10, 'maxval': 100}),
+
+        # Options
+        ('homing_method', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('sensorless_selector', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('enable_clog_detection', 'getint', (2,), {'minval': 0, 'maxval': 2}),
+        ('persistence_level', 'getint', (0,), {'minval': 0, 'maxval': 4}),
+
+        # Logging
+        ('logfile_level', 'getint', (3,), {'minval': -1, 'maxval': 4}),
+        ('log_statistics', 'getint', (0,), {'minval': 0, 'maxval': 1}),
+        ('startup_status', 'getint', (0,), {'minval': 0, 'maxval': 2}),
+    ]
+
+    # Parameters adjustable at runtime with ERCF_TEST_CONFIG. The G-Code parameter is the upper case option name
+    TEST_CONFIG_PARAMETERS = [
+        ('long_moves_speed', 'get_float', {'above': 20.}),
+        ('long_moves_speed_from_spool', 'get_float', {'above': 20.}),
+        ('short_moves_speed', 'get_float', {'above': 20.}),
+        ('home_to_extruder', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('ignore_extruder_load_error', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('extruder_homing_max', 'get_float', {'above': 20.}),
+        ('extruder_homing_step', 'get_float', {'minval': 1., 'maxval': 5.}),
+        ('toolhead_homing_max', 'get_float', {'minval': 0.}),
+        ('toolhead_homing_step', 'get_float', {'minval': 0.5, 'maxval': 5.}),
+        ('extruder_homing_current', 'get_int', {'minval': 10, 'maxval': 100}),
+        ('extruder_form_tip_current', 'get_int', {'minval': 100, 'maxval': 150}),
+        ('delay_servo_release', 'get_float', {'minval': 0., 'maxval': 5.}),
+        ('sync_load_length', 'get_float', {'minval': 0., 'maxval': 100.}),
+        ('sync_load_speed', 'get_float', {'minval': 1., 'maxval': 100.}),
+        ('sync_unload_length', 'get_float', {'minval': 0., 'maxval': 100.}),
+        ('sync_unload_speed', 'get_float', {'minval': 1., 'maxval': 100.}),
+        ('sync_to_extruder', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('sync_load_extruder', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('sync_unload_extruder', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('sync_form_tip', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('sync_gear_current', 'get_int', {'minval': 10, 'maxval': 100}),
+        ('num_moves', 'get_int', {'minval': 1}),
+        ('apply_bowden_correction', 'get_int', {'minval': 0, 'maxval': 1}),
+        ('load_bowden_tolerance', 'get_float', {'minval': 1., 'maxval': 50.}),
+
+        ('home_position_to_nozzle', 'get_float', {'minval': 5.}),
+        ('extruder_to_nozzle', 'get_float', {'minval': 0.}),
+        ('sensor_to_nozzle', 'get_float', {'minval': 0.}),
+
+        ('nozzle_load_speed', 'get_float', {'minval': 1., 'maxval': 100.}),
+        ('nozzle_unload_speed', 'get_float', {'minval': 1., 'maxval': 100}),
+        ('z_hop_height', 'get_float', {'minval': 0.}),
+        ('z_hop_speed', 'get_float', {'minval': 1.}),
+        ('logLevel', 'get_int', {'minval': 0, 'maxval': 4}),
+        ('logVisual', 'get_int', {'minval': 0, 'maxval': 2}),
+        ('enable_clog_detection', 'get_int', {'minval': 0, 'maxval': 2}),
+        ('enable_endless_spool', 'get_int', {'minval': 0, 'maxval': 1}),
+    ]
+
+    # G-Code commands and the method implementing each. Help text comes from the matching '<method>_help' attribute
+    GCODE_COMMANDS = [
+        # Logging and Stats
+        ('ERCF_RESET', 'cmd_ERCF_RESET'),
+        ('ERCF_SET_logLevel', 'cmd_ERCF_SET_logLevel'),
+        ('ERCF_DISPLAY_ENCODER_POS', 'cmd_ERCF_DISPLAY_ENCODER_POS'),
+        ('ERCF_STATUS', 'cmd_ERCF_STATUS'),
+
+        # Calibration
+        ('ERCF_CALIBRATE', 'cmd_ERCF_CALIBRATE'),
+        ('ERCF_CALIBRATE_SINGLE', 'cmd_ERCF_CALIBRATE_SINGLE'),
+        ('ERCF_CALIBRATE_SELECTOR', 'cmd_ERCF_CALIBRATE_SELECTOR'),
+        ('ERCF_CALIB_SELECTOR', 'cmd_ERCF_CALIBRATE_SELECTOR'), # For backwards compatibility because it's mentioned in manual, but prefer to remove
+        ('ERCF_CALIBRATE_ENCODER', 'cmd_ERCF_CALIBRATE_ENCODER'),
+
+        # Servo and motor control
+        ('ERCF_SERVO_DOWN', 'cmd_ERCF_SERVO_DOWN'),
+        ('ERCF_SERVO_UP', 'cmd_ERCF_SERVO_UP'),
+        ('ERCF_MOTORS_OFF', 'cmd_ERCF_MOTORS_OFF'),
+        ('ERCF_BUZZ_GEAR_MOTOR', 'cmd_ERCF_BUZZ_GEAR_MOTOR'),
+        ('ERCF_SYNC_GEAR_MOTOR', 'cmd_ERCF_SYNC_GEAR_MOTOR'),
+
+        # Core ERCF functionality
+        ('ERCF_ENABLE', 'cmd_ERCF_ENABLE'),
+        ('ERCF_DISABLE', 'cmd_ERCF_DISABLE'),
+        ('ERCF_ENCODER', 'cmd_ERCF_ENCODER'),
+        ('ERCF_HOME', 'cmd_ERCF_HOME'),
+        ('ERCF_SELECT', 'cmd_ERCF_SELECT'),
+        ('ERCF_SELECT_TOOL', 'cmd_ERCF_SELECT'), # For backwards compatibility, but ERCF_SELECT is preferred
+        ('ERCF_PRELOAD', 'cmd_ERCF_PRELOAD'),
+        ('ERCF_CHANGE_TOOL', 'cmd_ERCF_CHANGE_TOOL'),
+        ('ERCF_LOAD', 'cmd_ERCF_LOAD'),
+        ('ERCF_EJECT', 'cmd_ERCF_EJECT'),
+        ('ERCF_UNLOCK', 'cmd_ERCF_UNLOCK'),
+        ('ERCF_PAUSE', 'cmd_ERCF_PAUSE'),
+        ('ERCF_RECOVER', 'cmd_ERCF_RECOVER'),
+
+        # Soak Testing
+        ('ERCF_SOAKTEST_SELECTOR', 'cmd_ERCF_SOAKTEST_SELECTOR'),
+        ('ERCF_SOAKTEST_LOAD_SEQUENCE', 'cmd_ERCF_SOAKTEST_LOAD_SEQUENCE'),
+
+        # User Setup and Testing
+        ('ERCF_TEST_GRIP', 'cmd_ERCF_TEST_GRIP'),
+        ('ERCF_TEST_SERVO', 'cmd_ERCF_TEST_SERVO'),
+        ('ERCF_TEST_MOVE_GEAR', 'cmd_ERCF_TEST_MOVE_GEAR'),
+        ('ERCF_TEST_LOAD', 'cmd_ERCF_TEST_LOAD'),
+        ('ERCF_TEST_TRACKING', 'cmd_ERCF_TEST_TRACKING'),
+        ('ERCF_TEST_UNLOAD', 'cmd_ERCF_TEST_UNLOAD'),
+        ('ERCF_TEST_HOME_TO_EXTRUDER', 'cmd_ERCF_TEST_HOME_TO_EXTRUDER'),
+        ('ERCF_TEST_CONFIG', 'cmd_ERCF_TEST_CONFIG'),
+
+        # Runout, TTG and Endless spool
+        ('_ERCF_ENCODER_RUNOUT', 'cmd_ERCF_ENCODER_RUNOUT'),
+        ('ERCF_DISPLAY_TTG_MAP', 'cmd_ERCF_DISPLAY_TTG_MAP'),
+        ('ERCF_REMAP_TTG', 'cmd_ERCF_REMAP_TTG'),
+        ('ERCF_SET_GATE_MAP', 'cmd_ERCF_SET_GATE_MAP'),
+        ('ERCF_ENDLESS_SPOOL', 'cmd_ERCF_ENDLESS_SPOOL'),
+        ('ERCF_CHECK_GATES', 'cmd_ERCF_CHECK_GATES'),
+    ]
 
     def __init__(self, config):
         self.config = config
@@ -170,130 +486,79 @@ class Ercf:
         self.selector_stepper = self.gear_stepper = self.encoder_sensor = self.servo = None
 
         # Specific build parameters / tuning
-        self.version = config.getfloat('version', 1.1)
+        for option, getter, default, limits in self.CONFIG_PARAMETERS:
+            setattr(self, option, getattr(config, getter)(option, *default, **limits))
+        if self.homing_method == self.EXTRUDER_STALLGUARD:
+            self._home_to_extruder_impl = self._home_to_extruder_with_stallguard
+        else:
+            self._home_to_extruder_impl = self._home_to_extruder_collision_detection
         self.extruder_name = config.get('extruder', 'extruder')
-        self.long_moves_speed = config.getfloat('long_moves_speed', 100., minval=1.)
         self.long_moves_speed_from_spool = config.getfloat('long_moves_speed_from_spool', self.long_moves_speed, minval=1.)
-        self.short_moves_speed = config.getfloat('short_moves_speed', 25., minval=1.)
-        self.z_hop_height = config.getfloat('z_hop_height', 5., minval=0.)
-        self.z_hop_speed = config.getfloat('z_hop_speed', 15., minval=1.)
-        self.gear_homing_accel = config.getfloat('gear_homing_accel', 1000)
-        self.gear_sync_accel = config.getfloat('gear_sync_accel', 1000)
-        self.gear_buzz_accel = config.getfloat('gear_buzz_accel', 2000)
-        self.servo_up_angle = config.getfloat('servo_up_angle')
-        self.servo_down_angle = config.getfloat('servo_down_angle')
-        self.servo_duration = config.getfloat('servo_duration', 0.2, minval=0.1)
-        self.num_moves = config.getint('num_moves', 1, minval=1)
-        self.apply_bowden_correction = config.getint('apply_bowden_correction', 0, minval=0, maxval=1)
-        self.load_bowden_tolerance = config.getfloat('load_bowden_tolerance', 10., minval=1.)
         self.unload_bowden_tolerance = config.getfloat('unload_bowden_tolerance', self.load_bowden_tolerance, minval=1.)
-        self.parking_distance = config.getfloat('parking_distance', 23., minval=12., maxval=130.)
-        self.encoder_move_step_size = config.getfloat('encoder_move_step_size', 15., minval=5., maxval=25.)
-        self.load_encoder_retries = config.getint('load_encoder_retries', 2, minval=1, maxval=5)
         self.selector_offsets = list(config.getfloatlist('colorselector'))
-        self.timeout_pause = config.getint('timeout_pause', 72000)
-        self.timeout_unlock = config.getint('timeout_unlock', -1)
-        self.disable_heater = config.getint('disable_heater', 600)
-        self.min_temp_extruder = config.getfloat('min_temp_extruder', 180.)
-        self.calibration_bowden_length = config.getfloat('calibration_bowden_length')
-        self.unload_buffer = config.getfloat('unload_buffer', 30., minval=15.)
-        self.home_to_extruder = config.getint('home_to_extruder', 0, minval=0, maxval=1)
-        self.ignore_extruder_load_error = config.getint('ignore_extruder_load_error', 0, minval=0, maxval=1)
-        self.extruder_homing_max = config.getfloat('extruder_homing_max', 50., above=20.)
-        self.extruder_homing_step = config.getfloat('extruder_homing_step', 2., minval=0.5, maxval=5.)
-        self.extruder_homing_current = config.getint('extruder_homing_current', 50, minval=10, maxval=100)
-        self.extruder_form_tip_current = config.getint('extruder_form_tip_current', 100, minval=100, maxval=150)
-        self.toolhead_homing_max = config.getfloat('toolhead_homing_max', 20., minval=0.)
-        self.toolhead_homing_step = config.getfloat('toolhead_homing_step', 1., minval=0.5, maxval=5.)
-        self.sync_load_length = config.getfloat('sync_load_length', 8., minval=0., maxval=100.) # keep?
-        self.sync_load_speed = config.getfloat('sync_load_speed', 10., minval=1., maxval=100.)
-        self.sync_unload_length = config.getfloat('sync_unload_length', 10., minval=0., maxval=100.) # keep?
-        self.sync_unload_speed = config.getfloat('sync_unload_speed', 10., minval=1., maxval=100.)
-        self.delay_servo_release = config.getfloat('delay_servo_release', 2., minval=0., maxval=5.)
-        self.home_position_to_nozzle = config.getfloat('home_position_to_nozzle', minval=5.) # Legacy, separate measures below are preferred
-        self.extruder_to_nozzle = config.getfloat('extruder_to_nozzle', 0., minval=5.) # For sensorless
-        self.sensor_to_nozzle = config.getfloat('sensor_to_nozzle', 0., minval=5.) # For toolhead sensor
-        self.nozzle_load_speed = config.getfloat('nozzle_load_speed', 15, minval=1., maxval=100.)
-        self.nozzle_unload_speed = config.getfloat('nozzle_unload_speed', 20, minval=1., maxval=100.)
-        self.filamentblock_width = config.getfloat('filamentblock_width', 21.) # 21 for ERCF v1.1 default filament blocks
-
-        # Gear/Extruder synchronization controls
-        self.sync_to_extruder = config.getint('sync_to_extruder', 0, minval=0, maxval=1)
-        self.sync_load_extruder = config.getint('sync_load_extruder', 0, minval=0, maxval=1)
-        self.sync_unload_extruder = config.getint('sync_unload_extruder', 0, minval=0, maxval=1)
-        self.sync_form_tip = config.getint('sync_form_tip', 0, minval=0, maxval=1)
-        self.sync_gear_current = config.getint('sync_gear_current', 50, minval=10, maxval=100)
+        self._num_gates = len(self.selector_offsets) # Fixed by config, persisted offsets must match it
+        # Maximum selector travel needed to reach each gate from home (filament blocks plus spacers every 3 gates)
+        self.selector_move_lengths = [10. + gate*self.filamentblock_width + (gate//3)*5. + 30 for gate in range(self._num_gates)]
 
         # Options
-        self.homing_method = config.getint('homing_method', 0, minval=0, maxval=1)
-        self.sensorless_selector = config.getint('sensorless_selector', 0, minval=0, maxval=1)
-        self.enable_clog_detection = config.getint('enable_clog_detection', 2, minval=0, maxval=2)
         self.default_enable_endless_spool = config.getint('enable_endless_spool', 0, minval=0, maxval=1)
         self.default_endless_spool_groups = list(config.getintlist('endless_spool_groups', []))
         self.default_tool_to_gate_map = list(config.getintlist('tool_to_gate_map', []))
         self.default_gate_status = list(config.getintlist('gate_status', []))
         self.default_gate_material = list(config.getlist('gate_material', []))
         self.default_gate_color = list(config.getlist('gate_color', []))
-        self.persistence_level = config.getint('persistence_level', 0, minval=0, maxval=4)
 
         # Logging
         self.logLevel = config.getint('log_level', 1, minval=0, maxval=4)
-        self.logfile_level = config.getint('logfile_level', 3, minval=-1, maxval=4)
-        self.log_statistics = config.getint('log_statistics', 0, minval=0, maxval=1)
         self.logVisual = config.getint('log_visual', 1, minval=0, maxval=2)
-        self.startup_status = config.getint('startup_status', 0, minval=0, maxval=2)
 
         # The following lists are the defaults (when reset) and will be overriden by values in ercf_vars.cfg
+        num_gates = self._num_gates
 
         # Endless spool groups
         self.enable_endless_spool = self.default_enable_endless_spool
         if len(self.default_endless_spool_groups) > 0:
-            if self.enable_endless_spool == 1 and len(self.default_endless_spool_groups) != len(self.selector_offsets):
+            if self.enable_endless_spool == 1 and len(self.default_endless_spool_groups) != num_gates:
                 raise self.config.error("endless_spool_groups has a different number of values than the number of gates")
         else:
-            for i in range(len(self.selector_offsets)):
-                self.default_endless_spool_groups.append(i)
+            self.default_endless_spool_groups = list(range(num_gates))
         self.endless_spool_groups = list(self.default_endless_spool_groups)
 
         # Status (availability of filament) at each gate
         if len(self.default_gate_status) > 0:
-            if not len(self.default_gate_status) == len(self.selector_offsets):
+            if not len(self.default_gate_status) == num_gates:
                 raise self.config.error("gate_status has different number of values than the number of gates")
         else:
-            for i in range(len(self.selector_offsets)):
-                self.default_gate_status.append(self.GATE_UNKNOWN)
+            self.default_gate_status = [self.GATE_UNKNOWN] * num_gates
         self.gate_status = list(self.default_gate_status)
 
         # Filmament material at each gate
         if len(self.default_gate_material) > 0:
-            if not len(self.default_gate_material) == len(self.selector_offsets):
+            if not len(self.default_gate_material) == num_gates:
                 raise self.config.error("gate_material has different number of entries than the number of gates")
         else:
-            for i in range(len(self.selector_offsets)):
-                self.default_gate_material.append("")
+            self.default_gate_material = [""] * num_gates
         self.gate_material = list(self.default_gate_material)
 
         # Filmament color at each gate
         if len(self.default_gate_color) > 0:
-            if not len(self.default_gate_color) == len(self.selector_offsets):
+            if not len(self.default_gate_color) == num_gates:
                 raise self.config.error("gate_color has different number of entries than the number of gates")
         else:
-            for i in range(len(self.selector_offsets)):
-                self.default_gate_color.append("")
+            self.default_gate_color = [""] * num_gates
         self.gate_color = list(self.default_gate_color)
 
         # Tool to gate mapping
         if len(self.default_tool_to_gate_map) > 0:
-            if not len(self.default_tool_to_gate_map) == len(self.selector_offsets):
+            if not len(self.default_tool_to_gate_map) == num_gates:
                 raise self.config.error("tool_to_gate_map has different number of values than the number of gates")
         else:
-            for i in range(len(self.selector_offsets)):
-                self.default_tool_to_gate_map.append(i)
+            self.default_tool_to_gate_map = list(range(num_gates))
         self.tool_to_gate_map = list(self.default_tool_to_gate_map)
+        self._rebuild_gate_index()
 
-        try:
-            self.pauseResume = self.printer.lookup_object("pause_resume")
-        except:
+        self.pauseResume = self.printer.lookup_object("pause_resume", None)
+        if self.pauseResume is None:
             raise self.config.error("ERCF requires [pause_resume] to work, please add it to your config!")
 
         # Initialize state and statistics variables
@@ -301,153 +566,14 @@ class Ercf:
 
         # Logging
         self.queueListener = None
+        self.queueHandler = None
         self.ercf_logger = None
 
         # Register GCODE commands
         self.gcode = self.printer.lookup_object('gcode')
-
-        # Logging and Stats
-        self.gcode.register_command('ERCF_RESET',
-                    self.cmd_ERCF_RESET,
-                    desc = self.cmd_ERCF_RESET_help)
-        self.gcode.register_command('ERCF_SET_logLevel',
-                    self.cmd_ERCF_SET_logLevel,
-                    desc = self.cmd_ERCF_SET_logLevel_help)
-        self.gcode.register_command('ERCF_DISPLAY_ENCODER_POS',
-                    self.cmd_ERCF_DISPLAY_ENCODER_POS,
-                    desc = self.cmd_ERCF_DISPLAY_ENCODER_POS_help)
-        self.gcode.register_command('ERCF_STATUS',
-                    self.cmd_ERCF_STATUS,
-                    desc = self.cmd_ERCF_STATUS_help)
-
-	# Calibration
-        self.gcode.register_command('ERCF_CALIBRATE',
-                    self.cmd_ERCF_CALIBRATE,
-                    desc = self.cmd_ERCF_CALIBRATE_help)
-        self.gcode.register_command('ERCF_CALIBRATE_SINGLE',
-                    self.cmd_ERCF_CALIBRATE_SINGLE,
-                    desc = self.cmd_ERCF_CALIBRATE_SINGLE_help)
-        self.gcode.register_command('ERCF_CALIBRATE_SELECTOR',
-                    self.cmd_ERCF_CALIBRATE_SELECTOR,
-                    desc = self.cmd_ERCF_CALIBRATE_SELECTOR_help)
-        self.gcode.register_command('ERCF_CALIB_SELECTOR',
-                    self.cmd_ERCF_CALIBRATE_SELECTOR,
-                    desc = self.cmd_ERCF_CALIBRATE_SELECTOR_help) # For backwards compatibility because it's mentioned in manual, but prefer to remove
-        self.gcode.register_command('ERCF_CALIBRATE_ENCODER',
-                    self.cmd_ERCF_CALIBRATE_ENCODER,
-                    desc=self.cmd_ERCF_CALIBRATE_ENCODER_help)
-
-        # Servo and motor control
-        self.gcode.register_command('ERCF_SERVO_DOWN',
-                    self.cmd_ERCF_SERVO_DOWN,
-                    desc = self.cmd_ERCF_SERVO_DOWN_help)
-        self.gcode.register_command('ERCF_SERVO_UP',
-                    self.cmd_ERCF_SERVO_UP,
-                    desc = self.cmd_ERCF_SERVO_UP_help)
-        self.gcode.register_command('ERCF_MOTORS_OFF',
-                    self.cmd_ERCF_MOTORS_OFF,
-                    desc = self.cmd_ERCF_MOTORS_OFF_help)
-        self.gcode.register_command('ERCF_BUZZ_GEAR_MOTOR',
-                    self.cmd_ERCF_BUZZ_GEAR_MOTOR,
-                    desc=self.cmd_ERCF_BUZZ_GEAR_MOTOR_help)
-        self.gcode.register_command('ERCF_SYNC_GEAR_MOTOR',
-                    self.cmd_ERCF_SYNC_GEAR_MOTOR,
-                    desc=self.cmd_ERCF_SYNC_GEAR_MOTOR_help)
-
-	# Core ERCF functionality
-        self.gcode.register_command('ERCF_ENABLE',
-                    self.cmd_ERCF_ENABLE,
-                    desc = self.cmd_ERCF_ENABLE_help)
-        self.gcode.register_command('ERCF_DISABLE',
-                    self.cmd_ERCF_DISABLE,
-                    desc = self.cmd_ERCF_DISABLE_help)
-        self.gcode.register_command('ERCF_ENCODER',
-                    self.cmd_ERCF_ENCODER,
-                    desc = self.cmd_ERCF_ENCODER_help)
-        self.gcode.register_command('ERCF_HOME',
-                    self.cmd_ERCF_HOME,
-                    desc = self.cmd_ERCF_HOME_help)
-        self.gcode.register_command('ERCF_SELECT',
-                    self.cmd_ERCF_SELECT,
-                    desc = self.cmd_ERCF_SELECT_help)
-        self.gcode.register_command('ERCF_SELECT_TOOL', # For backwards compatibility, but ERCF_SELECT is preferred
-                    self.cmd_ERCF_SELECT,
-                    desc = self.cmd_ERCF_SELECT_help)
-        self.gcode.register_command('ERCF_PRELOAD',
-                    self.cmd_ERCF_PRELOAD,
-                    desc = self.cmd_ERCF_PRELOAD_help)
-        self.gcode.register_command('ERCF_CHANGE_TOOL',
-                    self.cmd_ERCF_CHANGE_TOOL,
-                    desc = self.cmd_ERCF_CHANGE_TOOL_help)
-        self.gcode.register_command('ERCF_LOAD',
-                    self.cmd_ERCF_LOAD,
-                    desc=self.cmd_ERCF_LOAD_help)
-        self.gcode.register_command('ERCF_EJECT',
-                    self.cmd_ERCF_EJECT,
-                    desc = self.cmd_ERCF_EJECT_help)
-        self.gcode.register_command('ERCF_UNLOCK',
-                    self.cmd_ERCF_UNLOCK,
-                    desc = self.cmd_ERCF_UNLOCK_help)
-        self.gcode.register_command('ERCF_PAUSE',
-                    self.cmd_ERCF_PAUSE,
-                    desc = self.cmd_ERCF_PAUSE_help)
-        self.gcode.register_command('ERCF_RECOVER',
-                    self.cmd_ERCF_RECOVER,
-                    desc = self.cmd_ERCF_RECOVER_help)
-
-	# Soak Testing
-        self.gcode.register_command('ERCF_SOAKTEST_SELECTOR',
-                    self.cmd_ERCF_SOAKTEST_SELECTOR,
-                    desc = self.cmd_ERCF_SOAKTEST_SELECTOR_help)
-        self.gcode.register_command('ERCF_SOAKTEST_LOAD_SEQUENCE',
-                    self.cmd_ERCF_SOAKTEST_LOAD_SEQUENCE,
-                    desc = self.cmd_ERCF_SOAKTEST_LOAD_SEQUENCE_help)
-
-	# User Setup and Testing
-        self.gcode.register_command('ERCF_TEST_GRIP',
-                    self.cmd_ERCF_TEST_GRIP,
-                    desc = self.cmd_ERCF_TEST_GRIP_help)
-        self.gcode.register_command('ERCF_TEST_SERVO',
-                    self.cmd_ERCF_TEST_SERVO,
-                    desc = self.cmd_ERCF_TEST_SERVO_help)
-        self.gcode.register_command('ERCF_TEST_MOVE_GEAR',
-                    self.cmd_ERCF_TEST_MOVE_GEAR,
-                    desc = self.cmd_ERCF_TEST_MOVE_GEAR_help)
-        self.gcode.register_command('ERCF_TEST_LOAD',
-                    self.cmd_ERCF_TEST_LOAD,
-                    desc=self.cmd_ERCF_TEST_LOAD_help)
-        self.gcode.register_command('ERCF_TEST_TRACKING',
-                    self.cmd_ERCF_TEST_TRACKING,
-                    desc=self.cmd_ERCF_TEST_TRACKING_help)
-        self.gcode.register_command('ERCF_TEST_UNLOAD',
-                    self.cmd_ERCF_TEST_UNLOAD,
-                    desc=self.cmd_ERCF_TEST_UNLOAD_help)
-        self.gcode.register_command('ERCF_TEST_HOME_TO_EXTRUDER',
-                    self.cmd_ERCF_TEST_HOME_TO_EXTRUDER,
-                    desc = self.cmd_ERCF_TEST_HOME_TO_EXTRUDER_help)
-        self.gcode.register_command('ERCF_TEST_CONFIG',
-                    self.cmd_ERCF_TEST_CONFIG,
-                    desc = self.cmd_ERCF_TEST_CONFIG_help)
-
-        # Runout, TTG and Endless spool
-        self.gcode.register_command('_ERCF_ENCODER_RUNOUT',
-                    self.cmd_ERCF_ENCODER_RUNOUT,
-                    desc = self.cmd_ERCF_ENCODER_RUNOUT_help)
-        self.gcode.register_command('ERCF_DISPLAY_TTG_MAP',
-                    self.cmd_ERCF_DISPLAY_TTG_MAP,
-                    desc = self.cmd_ERCF_DISPLAY_TTG_MAP_help)
-        self.gcode.register_command('ERCF_REMAP_TTG',
-                    self.cmd_ERCF_REMAP_TTG,
-                    desc = self.cmd_ERCF_REMAP_TTG_help)
-        self.gcode.register_command('ERCF_SET_GATE_MAP',
-                    self.cmd_ERCF_SET_GATE_MAP,
-                    desc = self.cmd_ERCF_SET_GATE_MAP_help)
-        self.gcode.register_command('ERCF_ENDLESS_SPOOL',
-                    self.cmd_ERCF_ENDLESS_SPOOL,
-                    desc = self.cmd_ERCF_ENDLESS_SPOOL_help)
-        self.gcode.register_command('ERCF_CHECK_GATES',
-                    self.cmd_ERCF_CHECK_GATES,
-                    desc = self.cmd_ERCF_CHECK_GATES_help)
+        self._respond_info, self._respond_raw = self.gcode.respond_info, self.gcode.respond_raw # Pre-bound for logging
+        for command, method in self.GCODE_COMMANDS:
+            self.gcode.register_command(command, getattr(self, method), desc=getattr(self, method + '_help'))
 
     def handle_connect(self):
         # Setup background file based logging before logging any messages
@@ -461,10 +587,11 @@ class Ercf:
             self.logDebug(f"ercf_log={ercf_log}")
             self.queueListener = QueueListener(ercf_log)
             self.queueListener.setFormatter(MultiLineFormatter('%(asctime)s %(message)s', datefmt='%I:%M:%S'))
-            queueHandler = QueueHandler(self.queueListener.bg_queue)
+            self.log_flush_timer = self.reactor.register_timer(self._flush_log_batch, self.reactor.NEVER)
+            self.queueHandler = QueueHandler(self.queueListener.bg_queue, self._schedule_log_flush)
             self.ercf_logger = logging.getLogger('ercf')
             self.ercf_logger.setLevel(logging.INFO)
-            self.ercf_logger.addHandler(queueHandler)
+            self.ercf_logger.addHandler(self.queueHandler)
 
         self.toolhead = self.printer.lookup_object('toolhead')
         for manual_stepper in self.printer.lookup_objects('manual_stepper'):
@@ -478,7 +605,7 @@ class Ercf:
             if stepper_name == 'manual_extruder_stepper gear_stepper':
                 self.gear_stepper = manual_stepper[1]
         if self.gear_stepper is None:
-            raise self.config.error(f"Missing [manual_extruder_stepper gear_stepper] definition in ercf_hardware.cfg\n{self.UPGRADE_REMINDER}")
+            raise self.config.error(self.MISSING_GEAR_STEPPER_ERROR)
 
         # Get endstops
         self.query_endstops = self.printer.lookup_object('query_endstops')
@@ -494,10 +621,10 @@ class Ercf:
         # Get servo and encoder
         self.servo = self.printer.lookup_object('ercf_servo ercf_servo', None)
         if not self.servo:
-            raise self.config.error(f"Missing [ercf_servo] definition in ercf_hardware.cfg\n{self.UPGRADE_REMINDER}")
+            raise self.config.error(self.MISSING_SERVO_ERROR)
         self.encoder_sensor = self.printer.lookup_object('ercf_encoder ercf_encoder', None)
         if not self.encoder_sensor:
-            raise self.config.error(f"Missing [ercf_encoder] definition in ercf_hardware.cfg\n{self.UPGRADE_REMINDER}")
+            raise self.config.error(self.MISSING_ENCODER_ERROR)
 
         # Sanity check extruder name
         self.extruder = self.printer.lookup_object(self.extruder_name, None)
@@ -507,21 +634,17 @@ class Ercf:
         # See if we have a TMC controller capable of current control for filament collision detection and syncing
         # on gear_stepper and tip forming on extruder
         self.gear_tmc = self.extruder_tmc = None
-        tmc_chips = ["tmc2209", "tmc2130", "tmc2208", "tmc2660", "tmc5160", "tmc2240"]
+        tmc_chips = ["tmc2209", "tmc2208", "tmc2130", "tmc5160", "tmc2240", "tmc2660"] # Most common first
         for chip in tmc_chips:
-            try:
-                self.gear_tmc = self.printer.lookup_object('%s manual_extruder_stepper gear_stepper' % chip)
+            self.gear_tmc = self.printer.lookup_object(f"{chip} manual_extruder_stepper gear_stepper", None)
+            if self.gear_tmc is not None:
                 self.logDebug(f"Found {chip} on gear_stepper. Current control enabled")
                 break
-            except:
-                pass
         for chip in tmc_chips:
-            try:
-                self.extruder_tmc = self.printer.lookup_object(f"{chip} {self.extruder_name}")
+            self.extruder_tmc = self.printer.lookup_object(f"{chip} {self.extruder_name}", None)
+            if self.extruder_tmc is not None:
                 self.logDebug(f"Found {chip} on extruder. Current control enabled")
                 break
-            except:
-                pass
         if self.gear_tmc is None:
             self.logDebug("TMC driver not found for gear_stepper, cannot use current reduction for collision detection or while synchronized printing")
         if self.extruder_tmc is None:
@@ -531,20 +654,37 @@ class Ercf:
             self.logInfo("Warning: EndlessSpool mode requires clog detection to be enabled")
 
         self.ref_step_dist=self.gear_stepper.steppers[0].get_step_dist()
+        # Selector step distance never changes so measured travel only needs the mcu position
+        self._selector_mcu_stepper = self.selector_stepper.steppers[0]
+        self._selector_step_dist = self._selector_mcu_stepper.get_step_dist()
+        # Resolve how the gear step ratio is applied once rather than on every tool change
+        gear_stepper = self.gear_stepper.steppers[0]
+        if hasattr(gear_stepper, "set_rotation_distance"):
+            steps_per_rotation = gear_stepper.get_rotation_distance()[1]
+            self._apply_gear_step_dist = lambda step_dist: gear_stepper.set_rotation_distance(step_dist * steps_per_rotation)
+        else:
+            # Backwards compatibility for old klipper versions
+            self._apply_gear_step_dist = gear_stepper.set_step_dist
+        self._applied_gear_ratio = None
         self.variables = self.printer.lookup_object('save_variables').allVariables
 
         # Sanity check to see that ercf_vars.cfg is included
         if self.variables == {}:
             raise self.config.error("Calibration settings not found. ercf_vars.cfg probably not found. Check [save_variables] section in ercf_software.cfg")
 
+        # Objects used to determine print status (print_stats is only present with virtual sdcard)
+        self.print_stats = self.printer.lookup_object("print_stats", None)
+        self.idle_timeout = self.printer.lookup_object("idle_timeout")
+
         # Remember user setting of idle_timeout so it can be restored (if not overridden)
         if self.timeout_unlock < 0:
-            self.timeout_unlock = self.printer.lookup_object("idle_timeout").idle_timeout
+            self.timeout_unlock = self.idle_timeout.idle_timeout
 
         # Configure encoder
         self.encoder_sensor.set_logger(self.logDebug) # Combine with ERCF log
         self.encoder_sensor.set_extruder(self.extruder_name)
         self.encoder_sensor.set_mode(self.enable_clog_detection)
+        self._encoder_distance = self.encoder_sensor.get_distance # Pre-bound for use in movement loops
 
         # Restore state
         self._load_persisted_state()
@@ -563,16 +703,29 @@ class Ercf:
         self.action = self.ACTION_IDLE
         self.calibrating = False
         self.saved_toolhead_position = False
+        self._status_lists = {}
+        self._ttg_string_cache = None
+        self._gate_map_string_cache = None
+        self._defer_saves = False
+        self._pending_saves = {}
 
     def _load_persisted_state(self):
         self.logDebug(f"Loaded persisted ERCF state, level: {self.persistence_level}")
-        num_gates = len(self.selector_offsets)
+        vget = self.variables.get
+        num_gates = self._num_gates
         errors = []
 
+        # Persisted lists are only accepted if they have an entry for every gate
+        def expect_len(values, var):
+            if len(values) == num_gates:
+                return True
+            errors.append(f"Incorrect number of gates specified in {var}")
+            return False
+
         if self.persistence_level >= 4:
             # Load selected tool and gate
-            tool_selected = self.variables.get(self.VARS_ERCF_TOOL_SELECTED, self.tool_selected)
-            gate_selected = self.variables.get(self.VARS_ERCF_GATE_SELECTED, self.gate_selected)
+            tool_selected = vget(self.VARS_ERCF_TOOL_SELECTED, self.tool_selected)
+            gate_selected = vget(self.VARS_ERCF_GATE_SELECTED, self.gate_selected)
             if gate_selected < num_gates and tool_selected < num_gates:
                 self.tool_selected = tool_selected
                 self.gate_selected = gate_selected
@@ -584,92 +737,72 @@ class Ercf:
             else:
                 errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_TOOL_SELECTED} or {self.VARS_ERCF_GATE_SELECTED}")
             if gate_selected != self.GATE_UNKNOWN and tool_selected != self.TOOL_UNKNOWN:
-                self.loaded_status = self.variables.get(self.VARS_ERCF_LOADED_STATUS, self.loaded_status)
+                self.loaded_status = vget(self.VARS_ERCF_LOADED_STATUS, self.loaded_status)
 
-        if self.persistence_level >= 3:
-            # Load gate status (filament present or not)
-            gate_status = self.variables.get(self.VARS_ERCF_GATE_STATUS, self.gate_status)
-            if len(gate_status) == num_gates:
-                self.gate_status = gate_status
-            else:
-                errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_GATE_STATUS}")
-
-            # Load filament material at each gate
-            gate_material = self.variables.get(self.VARS_ERCF_GATE_MATERIAL, self.gate_material)
-            if len(gate_status) == num_gates:
-                self.gate_material = gate_material
-            else:
-                errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_GATE_MATERIAL}")
-
-            # Load filament color at each gate
-            gate_color = self.variables.get(self.VARS_ERCF_GATE_COLOR, self.gate_color)
-            if len(gate_status) == num_gates:
-                self.gate_color = gate_color
-            else:
-                errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_GATE_COLOR}")
-
-        if self.persistence_level >= 2:
-            # Load tool to gate map
-            tool_to_gate_map = self.variables.get(self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map)
-            if len(tool_to_gate_map) == num_gates:
-                self.tool_to_gate_map = tool_to_gate_map
-            else:
-                errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_TOOL_TO_GATE_MAP}")
+        # Load per-gate lists (gate status, material, color, TTG map, EndlessSpool groups)
+        for level, attr, var in self.PERSISTED_GATE_LISTS:
+            if self.persistence_level >= level:
+                values = vget(var, getattr(self, attr))
+                if expect_len(values, var):
+                    setattr(self, attr, values)
+        self._rebuild_gate_index()
 
         if self.persistence_level >= 1:
             # Load EndlessSpool config
-            self.enable_endless_spool = self.variables.get(self.VARS_ERCF_ENABLE_ENDLESS_SPOOL, self.enable_endless_spool)
-            endless_spool_groups = self.variables.get(self.VARS_ERCF_ENDLESS_SPOOL_GROUPS, self.endless_spool_groups)
-            if len(endless_spool_groups) == num_gates:
-                self.endless_spool_groups = endless_spool_groups
-            else:
-                errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_ENDLESS_SPOOL_GROUPS}")
+            self.enable_endless_spool = vget(self.VARS_ERCF_ENABLE_ENDLESS_SPOOL, self.enable_endless_spool)
 
         # Load selector/gate calibration offsets
-        selector_offsets = self.variables.get(self.VARS_ERCF_SELECTOR_OFFSETS, [])
-        if len(selector_offsets) == num_gates:
+        selector_offsets = vget(self.VARS_ERCF_SELECTOR_OFFSETS, [])
+        if expect_len(selector_offsets, self.VARS_ERCF_SELECTOR_OFFSETS):
             self.selector_offsets = selector_offsets
             self.logDebug(f"Loaded saved selector offsets: {selector_offsets}")
-        else:
-            errors.append(f"Incorrect number of gates specified in {self.VARS_ERCF_SELECTOR_OFFSETS}")
+
+        # Load gear calibration ratios so tool selection doesn't need to look them up by name
+        self.gate_ratios = [vget("%s%d" % (self.VARS_ERCF_CALIB_PREFIX, gate), 1.) for gate in range(num_gates)]
 
         if len(errors) > 0:
-            self.logInfo(f"Warning: Some persisted state was ignored because it contained errors:\n{''.join(errors)}")
+            self.logInfo("Warning: Some persisted state was ignored because it contained errors:\n%s" % "\n".join(errors))
 
     def handle_disconnect(self):
         self.logDebug('ERCF Shutdown')
         if self.queueListener is not None:
+            self.queueHandler.flush()
             self.queueListener.stop()
 
+    # One-shot flush of a partial log batch, only armed while records are waiting
+    def _schedule_log_flush(self):
+        self.reactor.update_timer(self.log_flush_timer, self.reactor.monotonic() + self.LOG_FLUSH_INTERVAL)
+
+    def _flush_log_batch(self, eventtime):
+        self.queueHandler.flush()
+        return self.reactor.NEVER
+
     def handle_ready(self):
         self.printer.register_event_handler("idle_timeout:printing", self._handle_idle_timeout_printing)
-        self.printer.register_event_handler("idle_timeout:ready", self._handle_idle_timeout_ready)
-        self.printer.register_event_handler("idle_timeout:idle", self._handle_idle_timeout_idle)
+        self.printer.register_event_handler("idle_timeout:ready", self._handle_idle_timeout_not_printing)
+        self.printer.register_event_handler("idle_timeout:idle", self._handle_idle_timeout_not_printing)
         self._setup_heater_off_reactor()
         self.saved_toolhead_position = False
 
         # This is a bit naughty to register commands here but I need to make sure I'm the outermost wrapper
-        try:
-            originalResumeMacro = self.gcode.register_command('RESUME', None)
-            if originalResumeMacro is not None:
-                self.gcode.register_command('ERCF_SWIZZLED_RESUME', originalResumeMacro)
-                self.gcode.register_command('RESUME', self.cmd_ERCF_RESUME, desc = self.cmd_ERCF_RESUME_help)
-        except Exception as e:
-            self.logAlways('Warning: Error trying to wrap RESUME macro: %s' % str(e))
-
-        try:
-            originalCancelPrintMacro = self.gcode.register_command('CANCEL_PRINT', None)
-            if originalCancelPrintMacro is not None:
-                self.gcode.register_command('ERCF_SWIZZLED_CANCEL_PRINT', originalCancelPrintMacro)
-                self.gcode.register_command('CANCEL_PRINT', self.cmd_ERCF_CANCEL_PRINT, desc = self.cmd_ERCF_CANCEL_PRINT_help)
-        except Exception as e:
-            self.logAlways('Warning: Error trying to wrap CANCEL_PRINT macro: %s' % str(e))
+        self._wrap_gcode_command('RESUME', self.cmd_ERCF_RESUME, self.cmd_ERCF_RESUME_help)
+        self._wrap_gcode_command('CANCEL_PRINT', self.cmd_ERCF_CANCEL_PRINT, self.cmd_ERCF_CANCEL_PRINT_help)
 
         self.estimated_print_time = self.printer.lookup_object('mcu').estimated_print_time
         self.last_sensorless_move = self.estimated_print_time(self.reactor.monotonic())
         waketime = self.reactor.monotonic() + self.BOOT_DELAY
         self.reactor.register_callback(self._bootup_tasks, waketime)
 
+    # Replace an existing command with ours, keeping the original callable as ERCF_SWIZZLED_<command>
+    def _wrap_gcode_command(self, command, handler, help_text):
+        try:
+            original = self.gcode.register_command(command, None)
+            if original is not None:
+                self.gcode.register_command('ERCF_SWIZZLED_%s' % command, original)
+                self.gcode.register_command(command, handler, desc = help_text)
+        except Exception as e:
+            self.logAlways('Warning: Error trying to wrap %s macro: %s' % (command, str(e)))
+
     def _bootup_tasks(self, eventtime):
         try:
             self.encoder_sensor.set_clog_detection_length(self.variables.get(self.VARS_ERCF_CALIB_CLOG_LENGTH))
@@ -686,17 +819,7 @@ class Ercf:
 ####################################
 
     def _get_action_string(self):
-        return ("Idle" if self.action == self.ACTION_IDLE else
-                "Loading" if self.action == self.ACTION_LOADING else
-                "Unloading" if self.action == self.ACTION_UNLOADING else
-                "Loading Ext" if self.action == self.ACTION_LOADING_EXTRUDER else
-                "Exiting Ext" if self.action == self.ACTION_UNLOADING_EXTRUDER else
-                "Forming Tip" if self.action == self.ACTION_FORMING_TIP else
-                "Heating" if self.action == self.ACTION_HEATING else
-                "Checking" if self.action == self.ACTION_CHECKING else
-                "Homing" if self.action == self.ACTION_HOMING else
-                "Selecting" if self.action == self.ACTION_SELECTING else
-                "Unknown") # Error case - should not happen
+        return self.ACTION_STRINGS.get(self.action, "Unknown") # Unknown is error case - should not happen
 
     def get_status(self, eventtime):
         return {
@@ -712,57 +835,61 @@ class Ercf:
                 'last_toolchange': self._last_toolchange,
                 'clog_detection': self.enable_clog_detection,
                 'endless_spool': self.enable_endless_spool,
-                'filament': "Loaded" if self.loaded_status == self.LOADED_STATUS_FULL else
-                            "Unloaded" if self.loaded_status == self.LOADED_STATUS_UNLOADED else
-                            "Unknown",
+                'filament': self.FILAMENT_STRINGS.get(self.loaded_status, "Unknown"),
                 'loaded_status': self.loaded_status,
                 'filament_direction': self.filament_direction,
-                'servo': "Up" if self.servo_state == self.SERVO_UP_STATE else
-                         "Down" if self.servo_state == self.SERVO_DOWN_STATE else
-                         "Unknown",
-                'ttg_map': list(self.tool_to_gate_map),
-                'gate_status': list(self.gate_status),
-                'gate_material': list(self.gate_material),
-                'gate_color': list(self.gate_color),
-                'endless_spool_groups': list(self.endless_spool_groups),
+                'servo': self.SERVO_STRINGS.get(self.servo_state, "Unknown"),
+                'ttg_map': self._status_list('ttg_map', self.tool_to_gate_map),
+                'gate_status': self._status_list('gate_status', self.gate_status),
+                'gate_material': self._status_list('gate_material', self.gate_material),
+                'gate_color': self._status_list('gate_color', self.gate_color),
+                'endless_spool_groups': self._status_list('endless_spool_groups', self.endless_spool_groups),
                 'action': self._get_action_string()
         }
 
+    # Return the last copy handed out for this status list, only copying again when the
+    # contents have changed. Webhooks diff against the previous result so the dict itself
+    # and any changed list must still be new objects
+    def _status_list(self, key, values):
+        snapshot = self._status_lists.get(key)
+        if snapshot != values:
+            snapshot = self._status_lists[key] = list(values)
+        return snapshot
+
     def _persist_gate_map(self):
-        self.gcode.run_script_from_command(f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_STATUS} VALUE='{self.gate_status}'")
-        materials = list(map(lambda x: ("\'%s\'" %x), self.gate_material))
-        self.gcode.run_script_from_command(f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_MATERIAL} VALUE='{materials}'")
-        colors = list(map(lambda x: ("\'%s\'" %x), self.gate_color))
-        self.gcode.run_script_from_command(f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_COLOR} VALUE='{colors}'")
+        # Quote each entry so the list survives gcode parameter parsing and loads back as strings
+        materials = ["'%s'" % m for m in self.gate_material]
+        colors = ["'%s'" % c for c in self.gate_color]
+        self.gcode.run_script_from_command(
+            f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_STATUS} VALUE='{self.gate_status}'\n"
+            f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_MATERIAL} VALUE='{materials}'\n"
+            f"SAVE_VARIABLE VARIABLE={self.VARS_ERCF_GATE_COLOR} VALUE='{colors}'")
 
     def logError(self, message):
         if self.ercf_logger:
             self.ercf_logger.info(message)
-        self.gcode.respond_raw(f"!! {message}")
+        self._respond_raw(f"!! {message}")
 
     def logAlways(self, message):
         if self.ercf_logger:
             self.ercf_logger.info(message)
-        self.gcode.respond_info(message)
+        self._respond_info(message)
 
-    def logInfo(self, message):
+    def logInfo(self, message, *args):
         if self.logLevel > 0:
-            self.gcode.respond_info(message)
+            self._respond_info(message % args if args else message)
 
-    def logDebug(self, message):
-        message = f"- DEBUG: {message}"
+    def logDebug(self, message, *args):
         if self.logLevel > 1:
-            self.gcode.respond_info(message)
+            self._respond_info("- DEBUG: " + (message % args if args else message))
 
-    def logTrace(self, message):
-        message = f"- - TRACE: {message}"
+    def logTrace(self, message, *args):
         if self.logLevel > 2:
-            self.gcode.respond_info(message)
+            self._respond_info("- - TRACE: " + (message % args if args else message))
 
-    def logStepper(self, message):
-        message = f"- - - STEPPER: {message}"
+    def logStepper(self, message, *args):
         if self.logLevel > 3:
-            self.gcode.respond_info(message)
+            self._respond_info("- - - STEPPER: " + (message % args if args else message))
 
     # Fun visual display of ERCF state
     def displayVisualState(self, direction=None, silent=False):
@@ -773,44 +900,16 @@ class Ercf:
             self.logAlways(visual_str)
 
     def createStateString(self, direction=None):
+        templates = self.VISUAL_TEMPLATES.get(self.loaded_status)
+        if templates is None:
+            return "" # Unrecognized (e.g. stale persisted) loaded status
         tool_str = str(self.tool_selected) if self.tool_selected >=0 else "?"
-        counter_str = f" (@{self.encoder_sensor.get_distance()} mm)"
-        visual = visual2 = ""
-        if self.loaded_status == self.LOADED_STATUS_UNKNOWN:
-            visual = f"ERCF [T{tool_str}] ..... [encoder] ............. [extruder] ...... [nozzle] UNKNOWN"
-        elif self.loaded_status == self.LOADED_STATUS_UNLOADED:
-            visual = f"ERCF [T{tool_str}] >.... [encoder] ............. [extruder] ...... [nozzle] UNLOADED"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_BEFORE_ENCODER:
-            visual = f"ERCF [T{tool_str}] >>>.. [encoder] ............. [extruder] ...... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_PAST_ENCODER:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>........... [extruder] ...... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_IN_BOWDEN:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>...... [extruder] ...... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_END_OF_BOWDEN:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] ...... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_HOMED_EXTRUDER:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>>>>>>| [extruder] ...... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_HOMED_SENSOR:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>|... [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_PARTIAL_IN_EXTRUDER:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>>>.. [nozzle]"
-            visual += counter_str
-        elif self.loaded_status == self.LOADED_STATUS_FULL:
-            visual = f"ERCF [T{tool_str}] >>>>> [encoder] >>>>>>>>>>>>> [extruder] >>>>>> [nozzle] LOADED"
-            visual += counter_str
-
-        visual2 = visual.replace("encoder", "En").replace("extruder", "Ex").replace("sensor", "Ts").replace("nozzle", "Nz").replace(">>", ">").replace("..", ".").replace("--", "-")
+        visual = templates[1 if self.logVisual == 2 else 0].format(t=tool_str)
+        if self.loaded_status != self.LOADED_STATUS_UNKNOWN:
+            visual += f" (@{self.encoder_sensor.get_distance()} mm)"
         if self.filament_direction == self.DIRECTION_UNLOAD:
             visual = visual.replace(">", "<")
-            visual2 = visual2.replace(">", "<")
-        return visual2 if self.logVisual == 2 else visual
+        return visual
 
 ### LOGGING AND STATISTICS FUNCTIONS GCODE FUNCTIONS
 
@@ -828,7 +927,7 @@ class Ercf:
     cmd_ERCF_STATUS_help = "Complete dump of current ERCF state and important configuration"
     def cmd_ERCF_STATUS(self, gcmd):
         config = gcmd.get_int('SHOWCONFIG', 0, minval=0, maxval=1)
-        msg = "ERCF with %d gates" % (len(self.selector_offsets))
+        msg = "ERCF with %d gates" % (self._num_gates)
         msg += " is %s" % ("DISABLED" if not self.is_enabled else "PAUSED/LOCKED" if self.is_paused_locked else "OPERATIONAL")
         msg += " with the servo in a %s position" % ("UP" if self.servo_state == self.SERVO_UP_STATE else "DOWN" if self.servo_state == self.SERVO_DOWN_STATE else "unknown")
         msg += ", Encoder reads %.2fmm" % self.encoder_sensor.get_distance()
@@ -862,8 +961,7 @@ class Ercf:
             msg += "\nClog detection is %s" % ("AUTOMATIC" if self.enable_clog_detection == self.encoder_sensor.RUNOUT_AUTOMATIC else "ENABLED" if self.enable_clog_detection == self.encoder_sensor.RUNOUT_STATIC else "DISABLED")
             msg += " (%.1fmm runout)" % self.encoder_sensor.get_clog_detection_length()
             msg += " and EndlessSpool is %s" % ("ENABLED" if self.enable_endless_spool else "DISABLED")
-            p = self.persistence_level
-            msg += ", %s state is persisted across restarts" % ("All" if p == 4 else "Gate status & TTG map & EndlessSpool groups" if p == 3 else "TTG map & EndlessSpool groups" if p == 2 else "EndlessSpool groups" if p == 1 else "No")
+            msg += ", %s state is persisted across restarts" % self.PERSISTENCE_STRINGS.get(self.persistence_level, "No")
         msg += "\n\nTool/gate mapping%s" % (" and EndlessSpool groups:" if self.enable_endless_spool else ":")
         msg += "\n%s" % self._tool_to_gate_map_to_human_string()
         self.logAlways(msg)
@@ -880,15 +978,16 @@ class Ercf:
     def servoDown(self):
         if self.servo_state == self.SERVO_DOWN_STATE: return
         self.logDebug("Setting servo to down angle: %d" % (self.servo_down_angle))
-        self.toolhead.wait_moves()
+        toolhead, gear_move, accel = self.toolhead, self._gear_stepper_move_wait, self.gear_buzz_accel
+        toolhead.wait_moves()
         self.servo.set_value(angle=self.servo_down_angle, duration=self.servo_duration)
         oscillations = 2
         for i in range(oscillations):
-            self.toolhead.dwell(0.05)
-            self._gear_stepper_move_wait(0.5, speed=25, accel=self.gear_buzz_accel, wait=False, sync=False)
-            self.toolhead.dwell(0.05)
-            self._gear_stepper_move_wait(-0.5, speed=25, accel=self.gear_buzz_accel, wait=False, sync=(i == oscillations - 1))
-        self.toolhead.dwell(max(0., self.servo_duration - (0.1 * oscillations)))
+            toolhead.dwell(0.05)
+            gear_move(0.5, speed=25, accel=accel, wait=False, sync=False)
+            toolhead.dwell(0.05)
+            gear_move(-0.5, speed=25, accel=accel, wait=False, sync=(i == oscillations - 1))
+        toolhead.dwell(max(0., self.servo_duration - (0.1 * oscillations)))
         self.servo_state = self.SERVO_DOWN_STATE
 
     def servoUp(self):
@@ -896,17 +995,18 @@ class Ercf:
         self.logDebug("Setting servo to up angle: %d" % (self.servo_up_angle))
         self.toolhead.dwell(0.2)
         self.toolhead.wait_moves()
-        initial_encoder_position = self.encoder_sensor.get_distance()
+        encoder = self.encoder_sensor
+        initial_encoder_position = encoder.get_distance()
         self.servo.set_value(angle=self.servo_up_angle, duration=self.servo_duration)
         self.servo_state = self.SERVO_UP_STATE
 
         # Report on spring back in filament then reset counter
         self.toolhead.dwell(max(self.servo_duration, 0.4))
         self.toolhead.wait_moves()
-        delta = self.encoder_sensor.get_distance() - initial_encoder_position
+        delta = encoder.get_distance() - initial_encoder_position
         if delta > 0.:
             self.logDebug("Spring in filament measured  %.1fmm - adjusting encoder" % delta)
-            self.encoder_sensor.set_distance(initial_encoder_position)
+            encoder.set_distance(initial_encoder_position)
         return delta
 
     def _motors_off(self, motor="all"):
@@ -964,7 +1064,7 @@ class Ercf:
     def getGateRatio(self, gate):
         if gate < 0:
             return 1.0
-        ratio = self.variables.get("%s%d" % (self.VARS_ERCF_CALIB_PREFIX, gate), 1.)
+        ratio = self.gate_ratios[gate]
         if ratio > 0.9 and ratio < 1.1:
             return ratio
         else:
@@ -979,13 +1079,15 @@ class Ercf:
             reference_sum = spring_max = 0.
             successes = 0
             self._set_above_min_temp() # This will ensure the extruder stepper is powered to resist collision
+            encoder = self.encoder_sensor
+            bowden_length, unload_buffer = self.calibration_bowden_length, self.unload_buffer
             for i in range(repeats):
-                self.encoder_sensor.reset_counts()    # Encoder 0000
+                encoder.reset_counts()    # Encoder 0000
                 encoder_moved = self._load_encoder(retry=False)
-                self._load_bowden(self.calibration_bowden_length - encoder_moved)
+                self._load_bowden(bowden_length - encoder_moved)
                 self.logInfo("Finding extruder gear position (try #%d of %d)..." % (i+1, repeats))
                 self._home_to_extruder(extruder_homing_length)
-                measured_movement = self.encoder_sensor.get_distance()
+                measured_movement = encoder.get_distance()
                 spring = self.servoUp()
                 self.logAlways("Spring: %.1f" % spring)
                 reference = measured_movement - (spring * 0.1)
@@ -1008,9 +1110,9 @@ class Ercf:
                 spring_max = max(spring, spring_max)
                 successes += 1
 
-                self.encoder_sensor.reset_counts()    # Encoder 0000
-                self._unload_bowden(reference - self.unload_buffer)
-                self._unload_encoder(self.unload_buffer)
+                encoder.reset_counts()    # Encoder 0000
+                self._unload_bowden(reference - unload_buffer)
+                self._unload_encoder(unload_buffer)
                 self._set_loaded_status(self.LOADED_STATUS_UNLOADED)
 
             if successes > 0:
@@ -1022,6 +1124,7 @@ class Ercf:
                 self.logAlways(msg)
                 self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%.1f" % (self.VARS_ERCF_CALIB_REF, average_reference))
                 self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s%d VALUE=1.0" % (self.VARS_ERCF_CALIB_PREFIX, 0))
+                self.gate_ratios[0] = 1.
                 self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=3" % self.VARS_ERCF_CALIB_VERSION)
                 self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%.1f" % (self.VARS_ERCF_CALIB_CLOG_LENGTH, detection_length))
                 self.encoder_sensor.set_clog_detection_length(detection_length)
@@ -1050,6 +1153,7 @@ class Ercf:
             if not tool == 0:
                 if ratio > 0.8 and ratio < 1.2:
                     self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s%d VALUE=%.6f" % (self.VARS_ERCF_CALIB_PREFIX, tool, ratio))
+                    self.gate_ratios[tool] = round(ratio, 6)
                 else:
                     self.logAlways("Calibration ratio not saved because it is not considered valid (0.8 < ratio < 1.2)")
             self._unload_encoder(self.unload_buffer)
@@ -1063,9 +1167,9 @@ class Ercf:
     def sampleStats(self, values):
         mean = stdev = vmin = vmax = 0.
         if values:
-            mean = sum(values) / len(values)
-            diff2 = [( v - mean )**2 for v in values]
-            stdev = math.sqrt( sum(diff2) / max((len(values) - 1), 1))
+            n = len(values)
+            mean = sum(values) / n
+            stdev = math.sqrt(sum((v - mean)**2 for v in values) / max(n - 1, 1))
             vmin = min(values)
             vmax = max(values)
         return {'mean': mean, 'stdev': stdev, 'min': vmin, 'max': vmax, 'range': vmax - vmin}
@@ -1081,7 +1185,7 @@ class Ercf:
             self.calibrating = True
             self.logAlways("Start the complete auto calibration...")
             self._home(0)
-            for i in range(len(self.selector_offsets)):
+            for i in range(self._num_gates):
                 if i == 0:
                     self.calculateCalibrationReference()
                 else:
@@ -1097,7 +1201,7 @@ class Ercf:
     def cmd_ERCF_CALIBRATE_SINGLE(self, gcmd):
         if self._check_is_disabled(): return
         if self._check_is_paused(): return
-        tool = gcmd.get_int('TOOL', minval=0, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', minval=0, maxval=self._num_gates-1)
         repeats = gcmd.get_int('REPEATS', 3, minval=1, maxval=10)
         validate = gcmd.get_int('VALIDATE', 0, minval=0, maxval=1)
         try:
@@ -1147,15 +1251,17 @@ class Ercf:
                 if counts == 0: break
                 test_speed += speed_incr
 
+            plus_stats = self.sampleStats(plus_values)
+            min_stats = self.sampleStats(min_values)
             self.logAlways("Load direction: mean=%(mean).2f stdev=%(stdev).2f"
                               " min=%(min)d max=%(max)d range=%(range)d"
-                              % self.sampleStats(plus_values))
+                              % plus_stats)
             self.logAlways("Unload direction: mean=%(mean).2f stdev=%(stdev).2f"
                               " min=%(min)d max=%(max)d range=%(range)d"
-                              % self.sampleStats(min_values))
+                              % min_stats)
 
-            mean_plus = self.sampleStats(plus_values)['mean']
-            mean_minus = self.sampleStats(min_values)['mean']
+            mean_plus = plus_stats['mean']
+            mean_minus = min_stats['mean']
             half_mean = (float(mean_plus) + float(mean_minus)) / 4
 
             if half_mean == 0:
@@ -1190,24 +1296,23 @@ class Ercf:
     def cmd_ERCF_CALIBRATE_SELECTOR(self, gcmd):
         if self._check_is_disabled(): return
         if self._check_is_paused(): return
-        gate = gcmd.get_int('GATE', -1, minval=0, maxval=len(self.selector_offsets)-1)
+        gate = gcmd.get_int('GATE', -1, minval=0, maxval=self._num_gates-1)
         if gate == -1:
-            gate = gcmd.get_int('TOOL', minval=0, maxval=len(self.selector_offsets)-1)
+            gate = gcmd.get_int('TOOL', minval=0, maxval=self._num_gates-1)
         try:
             self.calibrating = True
             self.servoUp()
-            move_length = 10. + gate*self.filamentblock_width + (gate//3)*5 + 30
+            move_length = self.selector_move_lengths[gate]
             self.logAlways("Measuring the selector position for gate %d" % gate)
-            selector_steps = self.selector_stepper.steppers[0].get_step_dist()
-            init_mcu_pos = self.selector_stepper.steppers[0].get_mcu_position()
+            init_mcu_pos = self._selector_mcu_stepper.get_mcu_position()
             self.selector_stepper.do_set_position(0.)
             try:
                 self._selector_stepper_move_wait(-move_length, speed=60, homing_move=1)
             except Exception as e:
                 # Home definitely not found
                 pass
-            mcu_position = self.selector_stepper.steppers[0].get_mcu_position()
-            traveled = abs(mcu_position - init_mcu_pos) * selector_steps
+            mcu_position = self._selector_mcu_stepper.get_mcu_position()
+            traveled = abs(mcu_position - init_mcu_pos) * self._selector_step_dist
 
             # Test we actually homed, if not we didn't move far enough
             self.logAlways("Selector position = %.1fmm" % traveled)
@@ -1238,11 +1343,8 @@ class Ercf:
         if not self.is_enabled: return
         self._enable_encoder_sensor()
 
-    def _handle_idle_timeout_ready(self, eventtime):
-        if not self.is_enabled: return
-        self._disable_encoder_sensor()
-
-    def _handle_idle_timeout_idle(self, eventtime):
+    # Both the "ready" and "idle" states mean the printer has stopped printing
+    def _handle_idle_timeout_not_printing(self, eventtime):
         if not self.is_enabled: return
         self._disable_encoder_sensor()
 
@@ -1300,12 +1402,13 @@ class Ercf:
 
         # Immediately lift toolhead off print
         if self.z_hop_height > 0:
-            if 'z' not in self.toolhead.get_status(self.printer.get_reactor().monotonic())['homed_axes']:
+            toolhead_status = self.toolhead.get_status(self.reactor.monotonic())
+            if 'z' not in toolhead_status['homed_axes']:
                 self.logInfo("Warning: ERCF cannot lift toolhead because toolhead not homed!")
             else:
                 self.logDebug("Lifting toolhead %.1fmm" % self.z_hop_height)
                 act_z = self.toolhead.get_position()[2]
-                max_z = self.toolhead.get_status(self.printer.get_reactor().monotonic())['axis_maximum'].z
+                max_z = toolhead_status['axis_maximum'].z
                 if act_z < (max_z - self.z_hop_height):
                     safe_z = self.z_hop_height
                 else:
@@ -1355,7 +1458,7 @@ class Ercf:
         return False
 
     def _check_is_loaded(self):
-        if self.loaded_status not in (self.LOADED_STATUS_UNLOADED, self.LOADED_STATUS_UNKNOWN):
+        if self.loaded_status not in self.NOT_LOADED_STATES:
             self.logAlways("ERCF has filament loaded")
             return True
         return False
@@ -1367,21 +1470,19 @@ class Ercf:
         return self._get_print_status() == "paused"
 
     def _get_print_status(self):
-        try:
+        if self.print_stats is not None:
             # If using virtual sdcard this is the most reliable method
             source = "print_stats"
-            print_status = self.printer.lookup_object("print_stats").get_status(self.printer.get_reactor().monotonic())['state']
-        except:
+            print_status = self.print_stats.get_status(self.reactor.monotonic())['state']
+        else:
             # Otherwise we fallback to idle_timeout
             source = "idle_timeout"
             if self.pauseResume.is_paused:
                 print_status = "paused"
             else:
-                idle_timeout = self.printer.lookup_object("idle_timeout").get_status(self.printer.get_reactor().monotonic())
-                print_status = idle_timeout['state'].lower()
-        finally:
-            self.logTrace("Determined print status as: %s from %s" % (print_status, source))
-            return print_status
+                print_status = self.idle_timeout.get_status(self.reactor.monotonic())['state'].lower()
+        self.logTrace("Determined print status as: %s from %s", print_status, source)
+        return print_status
 
     # Ensure we are above desired or min temperature and that target is set
     def _set_above_min_temp(self, target_temp=-1):
@@ -1411,10 +1512,29 @@ class Ercf:
         self.displayVisualState(silent=silent)
 
         # Minimal save_variable writes
-        if state in (self.LOADED_STATUS_FULL, self.LOADED_STATUS_UNLOADED):
-            self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_LOADED_STATUS, state))
+        if state in self.PERSISTED_LOADED_STATES:
+            self._save_vars([(self.VARS_ERCF_LOADED_STATUS, state)])
         elif self.variables.get(self.VARS_ERCF_LOADED_STATUS, 0) != self.LOADED_STATUS_UNKNOWN:
-            self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_LOADED_STATUS, self.LOADED_STATUS_UNKNOWN))
+            self._save_vars([(self.VARS_ERCF_LOADED_STATUS, self.LOADED_STATUS_UNKNOWN)])
+
+    # Persist integer state variables in a single gcode script, or hold them until deferral
+    # ends so a short sequence (e.g. gate + tool selection) is written together. Keep deferral
+    # windows short: anything held back is lost if klippy stops before it is flushed
+    def _save_vars(self, pairs):
+        if self._defer_saves:
+            self._pending_saves.update(pairs)
+            return
+        self.gcode.run_script_from_command("\n".join("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % pair for pair in pairs))
+
+    # Returns the previous setting so callers can restore it. Ending deferral flushes pending writes
+    def _set_defer_saves(self, defer):
+        old_defer = self._defer_saves
+        self._defer_saves = defer
+        if not defer and self._pending_saves:
+            pairs = list(self._pending_saves.items())
+            self._pending_saves.clear()
+            self._save_vars(pairs)
+        return old_defer
 
     def _selected_tool_string(self):
         if self.tool_selected == self.TOOL_UNKNOWN:
@@ -1429,7 +1549,7 @@ class Ercf:
             return "#%d" % self.gate_selected
 
     def _is_filament_in_bowden(self):
-        if self.loaded_status in (self.LOADED_STATUS_PARTIAL_PAST_ENCODER, self.LOADED_STATUS_PARTIAL_IN_BOWDEN):
+        if self.loaded_status in self.IN_BOWDEN_STATES:
             return True
         return False
 
@@ -1478,18 +1598,20 @@ class Ercf:
     def cmd_ERCF_RESET(self, gcmd):
         self._initialize_state()
         self.enable_endless_spool = self.default_enable_endless_spool
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_ENABLE_ENDLESS_SPOOL, self.enable_endless_spool))
         self.endless_spool_groups = list(self.default_endless_spool_groups)
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_ENDLESS_SPOOL_GROUPS, self.endless_spool_groups))
         self.tool_to_gate_map = list(self.default_tool_to_gate_map)
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map))
+        self._rebuild_gate_index()
         self.gate_status = list(self.default_gate_status)
         self.gate_material = list(self.default_gate_material)
         self.gate_color = list(self.default_gate_color)
         self._persist_gate_map()
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_GATE_SELECTED, self.gate_selected))
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_TOOL_SELECTED, self.tool_selected))
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_LOADED_STATUS, self.loaded_status))
+        self.gcode.run_script_from_command(
+            "SAVE_VARIABLE VARIABLE=%s VALUE=%d\n" % (self.VARS_ERCF_ENABLE_ENDLESS_SPOOL, self.enable_endless_spool) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE='%s'\n" % (self.VARS_ERCF_ENDLESS_SPOOL_GROUPS, self.endless_spool_groups) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE='%s'\n" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE=%d\n" % (self.VARS_ERCF_GATE_SELECTED, self.gate_selected) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE=%d\n" % (self.VARS_ERCF_TOOL_SELECTED, self.tool_selected) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_LOADED_STATUS, self.loaded_status))
         self.logAlways("ERCF state reset")
 
 
@@ -1500,19 +1622,17 @@ class Ercf:
     def _gear_stepper_move_wait(self, dist, wait=True, speed=None, accel=None, sync=True):
         self._sync_gear_to_extruder(False) # Safety
         self.gear_stepper.do_set_position(0.)   # All gear moves are relative
-        is_long_move = abs(dist) > self.LONG_MOVE_THRESHOLD
         if speed is None:
-            if is_long_move:
-                if dist > 0 and self.gate_selected >= 0 and self.gate_status[self.gate_selected] != self.GATE_AVAILABLE_FROM_BUFFER:
-                    # Long pulling move when we are sure that we are at a gate but the filament buffer might be empty
-                    speed = self.long_moves_speed_from_spool
-                else:
-                    speed = self.long_moves_speed
-            else:
+            if abs(dist) <= self.LONG_MOVE_THRESHOLD:
                 speed = self.short_moves_speed
+            elif dist > 0 and self.gate_selected >= 0 and self.gate_status[self.gate_selected] != self.GATE_AVAILABLE_FROM_BUFFER:
+                # Long pulling move when we are sure that we are at a gate but the filament buffer might be empty
+                speed = self.long_moves_speed_from_spool
+            else:
+                speed = self.long_moves_speed
         if accel is None:
             accel = self.gear_stepper.accel
-        self.logStepper("GEAR: dist=%.1f, speed=%1.f, accel=%.1f sync=%s wait=%s" % (dist, speed, accel, sync, wait))
+        self.logStepper("GEAR: dist=%.1f, speed=%1.f, accel=%.1f sync=%s wait=%s", dist, speed, accel, sync, wait)
         self.gear_stepper.do_move(dist, speed, accel, sync)
         if wait:
             self.toolhead.wait_moves()
@@ -1524,45 +1644,46 @@ class Ercf:
     #         "synced" - gear and extruder synced together
     def _trace_filament_move(self, trace_str, distance, speed=None, accel=None, motor="gear", homing=False):
         self._sync_gear_to_extruder(motor == "synced")
-        start = self.encoder_sensor.get_distance()
-        trace_str += ". Stepper: '%s' moved %%.1fmm, encoder measured %%.1fmm (delta %%.1fmm)" % motor
+        start = self._encoder_distance()
+        trace_str += ". Stepper: '%s' moved %.1fmm, encoder measured %.1fmm (delta %.1fmm)"
+        toolhead, gear_stepper = self.toolhead, self.gear_stepper
         if motor == "both":
-            speed = speed or self.gear_stepper.velocity
-            accel = accel or self.gear_stepper.accel
-            self.logStepper("BOTH: dist=%.1f, speed=%.1f, accel=%.1f" % (distance, speed, self.gear_sync_accel))
-            self.gear_stepper.do_set_position(0.)                   # Make incremental move
-            pos = self.toolhead.get_position()
+            speed = speed or gear_stepper.velocity
+            accel = accel or gear_stepper.accel
+            self.logStepper("BOTH: dist=%.1f, speed=%.1f, accel=%.1f", distance, speed, self.gear_sync_accel)
+            gear_stepper.do_set_position(0.)                   # Make incremental move
+            pos = toolhead.get_position()
             pos[3] += distance
-            self.gear_stepper.do_move(distance, speed, self.gear_sync_accel, False)
-            self.toolhead.manual_move(pos, speed)
-            self.toolhead.dwell(0.05)                               # "MCU Timer too close" protection
-            self.toolhead.wait_moves()
-            self.toolhead.set_position(pos)                         # Force subsequent incremental move
+            gear_stepper.do_move(distance, speed, self.gear_sync_accel, False)
+            toolhead.manual_move(pos, speed)
+            toolhead.dwell(0.05)                               # "MCU Timer too close" protection
+            toolhead.wait_moves()
+            toolhead.set_position(pos)                         # Force subsequent incremental move
         elif motor == "gear":
             if homing:
                 # Special case to support stallguard homing of filament to extruder
-                self.gear_stepper.do_homing_move(
+                gear_stepper.do_homing_move(
                     distance,
-                    speed or self.gear_stepper.velocity,
-                    accel or self.gear_stepper.accel,
+                    speed or gear_stepper.velocity,
+                    accel or gear_stepper.accel,
                     True, False)
             else:
                 self._gear_stepper_move_wait(distance, speed=speed, accel=accel)
         else:   # Extruder only or Gear synced with extruder
-            speed = speed or self.gear_stepper.velocity
-            self.logStepper("%s: dist=%.1f, speed=%.1f" % (motor.upper(), distance, speed))
-            pos = self.toolhead.get_position()
+            speed = speed or gear_stepper.velocity
+            self.logStepper("%s: dist=%.1f, speed=%.1f", motor.upper(), distance, speed)
+            pos = toolhead.get_position()
             pos[3] += distance
-            self.toolhead.manual_move(pos, speed)
-            self.toolhead.wait_moves()
-            self.toolhead.set_position(pos)                         # Force subsequent incremental move
+            toolhead.manual_move(pos, speed)
+            toolhead.wait_moves()
+            toolhead.set_position(pos)                         # Force subsequent incremental move
 
-        end = self.encoder_sensor.get_distance()
+        end = self._encoder_distance()
         measured = end - start
         # Delta: +ve means measured less than moved, -ve means measured more than moved
         delta = abs(distance) - measured
-        trace_str += ". Counter: @%.1fmm" % end
-        self.logTrace(trace_str % (distance, measured, delta))
+        trace_str += ". Counter: @%.1fmm"
+        self.logTrace(trace_str, motor, distance, measured, delta, end)
         return delta
 
     def _selector_stepper_move_wait(self, dist, wait=True, speed=None, accel=None, homing_move=0):
@@ -1571,20 +1692,20 @@ class Ercf:
         if accel is None:
             accel = self.selector_stepper.accel
         if homing_move != 0:
-            self.logStepper("SELECTOR: dist=%.1f, speed=%.1f, accel=%.1f homing=%d" % (dist, speed, accel, homing_move))
+            self.logStepper("SELECTOR: dist=%.1f, speed=%.1f, accel=%.1f homing=%d", dist, speed, accel, homing_move)
             # Don't allow sensorless home moves in rapid succession (TMC limitation)
             if self.sensorless_selector == 1:
                 current_time = self.estimated_print_time(self.reactor.monotonic())
                 time_since_last = self.last_sensorless_move + 2.0 - current_time
                 if time_since_last > 0:
-                    self.logTrace("Wating %.2f seconds before next sensorless homing move" % time_since_last)
+                    self.logTrace("Wating %.2f seconds before next sensorless homing move", time_since_last)
                     self.toolhead.dwell(time_since_last)
                 self.last_sensorless_move = self.estimated_print_time(self.reactor.monotonic())
             elif abs(dist - self.selector_stepper.get_position()[0]) < 12: # Workaround for Timer Too Close error with short homing moves
                 self.toolhead.dwell(1)
             self.selector_stepper.do_homing_move(dist, speed, accel, homing_move > 0, abs(homing_move) == 1)
         else:
-            self.logStepper("SELECTOR: dist=%.1f, speed=%.1f, accel=%.1f" % (dist, speed, accel))
+            self.logStepper("SELECTOR: dist=%.1f, speed=%.1f, accel=%.1f", dist, speed, accel)
             self.selector_stepper.do_move(dist, speed, accel)
         if wait:
             self.toolhead.wait_moves()
@@ -1594,7 +1715,7 @@ class Ercf:
         self._gear_stepper_move_wait(2.0, wait=False)
         self._gear_stepper_move_wait(-2.0)
         delta = self.encoder_sensor.get_distance() - initial_encoder_position
-        self.logTrace("After buzzing gear motor, encoder moved %.2f" % delta)
+        self.logTrace("After buzzing gear motor, encoder moved %.2f", delta)
         self.encoder_sensor.set_distance(initial_encoder_position)
         return delta > self.ENCODER_MIN
 
@@ -1632,7 +1753,7 @@ class Ercf:
             self.logInfo("Reducing reducing gear_stepper run current to %d%% for extruder syncing" % self.sync_gear_current)
             self.gcode.run_script_from_command("SET_TMC_CURRENT STEPPER=gear_stepper CURRENT=%.2f"
                                                 % ((self.gear_stepper_run_current * self.sync_gear_current) / 100.))
-        elif not sync and self.gear_tmc and self.gear_tmc.get_status(0)['run_current'] < self.gear_stepper_run_current:
+        elif not sync and self.gear_stepper_run_current > 0 and self.gear_tmc and self.gear_tmc.get_status(0)['run_current'] < self.gear_stepper_run_current:
             self.logInfo("Restoring gear_stepper run current to 100% configured")
             self.gcode.run_script_from_command("SET_TMC_CURRENT STEPPER=gear_stepper CURRENT=%.2f" % self.gear_stepper_run_current)
             self.gear_stepper_run_current = -1
@@ -1658,9 +1779,10 @@ class Ercf:
             self.filament_direction = self.DIRECTION_LOAD
             self._set_loaded_status(self.LOADED_STATUS_UNLOADED)
             # If full length load requested then assume homing is required (if configured)
-            if length >= self.getCalibrationReference():
-                if length > self.getCalibrationReference():
-                    length = self.getCalibrationReference()
+            reference = self.getCalibrationReference()
+            if length >= reference:
+                if length > reference:
+                    length = reference
                     self.logInfo("Restricting load length to extruder calibration reference of %.1fmm" % length)
                 home = True
             else:
@@ -1689,7 +1811,7 @@ class Ercf:
             self._set_action(current_action)
 
     # Load filament past encoder and return the actual measured distance detected by encoder
-    def _load_encoder(self, retry=True, servo_up_on_error=True):
+    def _load_encoder(self, retry=True, servo_up_on_error=True, raise_on_fail=True):
         self.servoDown()
         self.filament_direction = self.DIRECTION_LOAD
         initial_encoder_position = self.encoder_sensor.get_distance()
@@ -1698,7 +1820,8 @@ class Ercf:
             msg = "Initial load into encoder" if i == 0 else ("Retry load into encoder #%d" % i)
             delta = self._trace_filament_move(msg, self.LONG_MOVE_THRESHOLD)
             if (self.LONG_MOVE_THRESHOLD - delta) > 6.0:
-                self._set_gate_status(self.gate_selected, max(self.gate_status[self.gate_selected], self.GATE_AVAILABLE)) # Don't reset if filament is buffered
+                if self.gate_status[self.gate_selected] < self.GATE_AVAILABLE: # Don't reset if filament is buffered
+                    self._set_gate_status(self.gate_selected, self.GATE_AVAILABLE)
                 self._set_loaded_status(self.LOADED_STATUS_PARTIAL_PAST_ENCODER)
                 return self.encoder_sensor.get_distance() - initial_encoder_position
             else:
@@ -1710,6 +1833,8 @@ class Ercf:
         self._set_loaded_status(self.LOADED_STATUS_UNLOADED)
         if servo_up_on_error:
             self.servoUp()
+        if not raise_on_fail:
+            return None # Caller expects misses, e.g. waiting for filament to be inserted
         raise ErcfError("Error picking up filament at gate - not enough movement detected at encoder")
 
     # Fast load of filament to approximate end of bowden (without homing)
@@ -1721,11 +1846,12 @@ class Ercf:
 
         # Fast load
         moves = 1 if length < (self.getCalibrationReference() / self.num_moves) else self.num_moves
+        move_length = length / moves
         delta = 0
+        self._set_loaded_status(self.LOADED_STATUS_PARTIAL_IN_BOWDEN)
         for i in range(moves):
             msg = "Course loading move #%d into bowden" % (i+1)
-            delta += self._trace_filament_move(msg, length / moves)
-            self._set_loaded_status(self.LOADED_STATUS_PARTIAL_IN_BOWDEN)
+            delta += self._trace_filament_move(msg, move_length)
 
         # Correction attempts to load the filament according to encoder reporting
         if delta >= tolerance and not self.calibrating:
@@ -1751,10 +1877,7 @@ class Ercf:
         self.servoDown()
         self.filament_direction = self.DIRECTION_LOAD
         self._set_above_min_temp() # This will ensure the extruder stepper is powered to resist collision
-        if self.homing_method == self.EXTRUDER_STALLGUARD:
-            homed, measured_movement = self._home_to_extruder_with_stallguard(max_length)
-        else:
-            homed, measured_movement = self._home_to_extruder_collision_detection(max_length)
+        homed, measured_movement = self._home_to_extruder_impl(max_length)
         if not homed:
             self._set_loaded_status(self.LOADED_STATUS_PARTIAL_END_OF_BOWDEN)
             raise ErcfError("Failed to reach extruder gear after moving %.1fmm" % max_length)
@@ -1773,13 +1896,14 @@ class Ercf:
             self.gcode.run_script_from_command("SET_TMC_CURRENT STEPPER=gear_stepper CURRENT=%.2f"
                                                 % ((gear_stepper_run_current * self.extruder_homing_current) / 100.))
 
-        initial_encoder_position = self.encoder_sensor.get_distance()
         homed = False
+        measured_movement = total_delta = 0.
         for i in range(int(max_length / step)):
             msg = "Homing step #%d" % (i+1)
             delta = self._trace_filament_move(msg, step, speed=5, accel=self.gear_homing_accel)
-            measured_movement = self.encoder_sensor.get_distance() - initial_encoder_position
-            total_delta = step*(i+1) - measured_movement
+            # Each step reports its own shortfall so the running totals don't need another encoder read
+            measured_movement += step - delta
+            total_delta += delta
             if delta >= step / 2. or abs(total_delta) > step: # Not enough or strange measured movement means we've hit the extruder
                 homed = True
                 break
@@ -1813,7 +1937,7 @@ class Ercf:
             self.filament_direction = self.DIRECTION_LOAD
             self._set_above_min_temp()
 
-            length = self._get_home_position_to_nozzle()
+            home_to_nozzle = length = self._get_home_position_to_nozzle()
             self.logDebug("Loading last %.1fmm to the nozzle..." % length)
             initial_encoder_position = self.encoder_sensor.get_distance()
 
@@ -1841,9 +1965,9 @@ class Ercf:
 
             # Final sanity check
             measured_movement = self.encoder_sensor.get_distance() - initial_encoder_position
-            total_delta = self._get_home_position_to_nozzle() - measured_movement
+            total_delta = home_to_nozzle - measured_movement
             self.logDebug("Total measured movement: %.1fmm, total delta: %.1fmm" % (measured_movement, total_delta))
-            tolerance = max(self.encoder_sensor.get_clog_detection_length(), self._get_home_position_to_nozzle() * 0.50)
+            tolerance = max(self.encoder_sensor.get_clog_detection_length(), home_to_nozzle * 0.50)
             if total_delta > tolerance:
                 msg = "Move to nozzle failed (encoder not sensing sufficient movement). Extruder may not have picked up filament or filament did not home correctly"
                 if not self.ignore_extruder_load_error:
@@ -1909,18 +2033,17 @@ class Ercf:
                 self.logAlways("Unloading from extruder")
                 self._unload_extruder()
                 self.servoDown()
-                self.logAlways("Move 1, 70")
+                self.logDebug("Move 1, %.1f", -70)
                 delta = self._trace_filament_move("1", -70, speed=self.sync_unload_speed, motor="both")
-                self.logAlways(f"Delta {delta}")
-                self.logAlways(f"Move 2, {-760+70}")
-                delta = self._trace_filament_move("2", -760+70, speed=self.long_moves_speed)
-                self.logAlways(f"Delta {delta}")
-                self.logAlways(f"Move 3, {-33}")
-                delta = self._trace_filament_move("3", -33, speed=20)
-                self.logAlways(f"Delta {delta}")
-                self.logAlways(f"Move 4, {-10}")
-                delta = self._trace_filament_move("4", -5, speed=20)
-                self.logAlways(f"Delta {delta}")
+                self.logDebug("Delta %.1f", delta)
+                # Remaining gear moves are only reported, so queue them back to back and measure once at the end
+                self.logDebug("Move 2, %.1f", -760+70)
+                start = self._encoder_distance()
+                self._gear_stepper_move_wait(-760+70, speed=self.long_moves_speed, wait=False)
+                self.logDebug("Move 3, %.1f", -33-5)
+                self._gear_stepper_move_wait(-33-5, speed=20) # Final slow pull
+                measured = self._encoder_distance() - start
+                self.logDebug("Delta %.1f", (760-70+33+5) - measured)
                 self.servoUp()
                 self._set_loaded_status(self.LOADED_STATUS_UNLOADED)
                 self._set_gate_status(self.gate_selected, self.GATE_AVAILABLE_FROM_BUFFER)
@@ -1985,22 +2108,23 @@ class Ercf:
 
             # Goal is to exit extruder. Strategies depend on availability of toolhead sensor and synced motor option
             out_of_extruder = False
+            step = self.encoder_move_step_size
+            max_length = self._get_home_position_to_nozzle() + step
+            full_speed, min_movement = self.nozzle_unload_speed, self.ENCODER_MIN
+            speed = full_speed * 0.5 # First pull slower just in case we don't have tip
 
             if not sync_allowed:
                 # No toolhead sensor and not syncing gear and extruder motors:
                 # Back up around 15mm at a time until either the encoder doesn't see any movement
                 # Do this until we have traveled more than the length of the extruder
-                step = self.encoder_move_step_size
-                max_length = self._get_home_position_to_nozzle() + step
-                speed = self.nozzle_unload_speed * 0.5 # First pull slower just in case we don't have tip
-                self.logDebug(f"Trying to exit the extruder, up to {max_length} mm in {step} mm steps")
-                for i in range(int(math.ceil(max_length / step))):
-                    msg = f"Step #{i + 1}:"
+                self.logDebug("Trying to exit the extruder, up to %.1fmm in %.1fmm steps", max_length, step)
+                for i in range(math.ceil(max_length / step)):
+                    msg = "Step #%d:" % (i+1)
                     delta = self._trace_filament_move(msg, -step, speed=speed, motor="extruder")
-                    speed = self.nozzle_unload_speed  # Can pull at full speed on subsequent steps
+                    speed = full_speed  # Can pull at full speed on subsequent steps
 
-                    if (step - delta) < self.ENCODER_MIN:
-                        self.logDebug(f"Extruder entrance reached after {i + 1} moves")
+                    if (step - delta) < min_movement:
+                        self.logDebug("Extruder entrance reached after %d moves", i+1)
                         out_of_extruder = True
                         break
 
@@ -2008,19 +2132,16 @@ class Ercf:
                 # No toolhead sensor with synced steppers:
                 # Back up in sync around 15mm at a time for more than length of the extruder
                 # Then back up the extruder a bit to make sure that the encoder doesn't see any movement
-                step = self.encoder_move_step_size
-                max_length = self._get_home_position_to_nozzle() + step
-                speed = self.nozzle_unload_speed * 0.5 # First pull slower just in case we don't have tip
-                self.logAlways(f"Trying to exit the extruder, up to {max_length} mm in {step} mm steps")
+                self.logDebug("Trying to exit the extruder, up to %.1fmm in %.1fmm steps", max_length, step)
                 stuck_in_extruder = False
-                for i in range(int(math.ceil(max_length / step))):
+                for i in range(math.ceil(max_length / step)):
                     msg = "Step #%d:" % (i+1)
-                    self.logAlways(f"Moving motors in sync, distance: {-step}")
+                    self.logDebug("Moving motors in sync, distance: %.1f", -step)
                     delta = self._trace_filament_move(msg, -step, speed=speed, motor="synced")
-                    self.logAlways(f"Motors moved, distance: {delta}")
-                    speed = self.nozzle_unload_speed  # Can pull at full speed on subsequent steps
+                    self.logDebug("Motors moved, distance: %.1f", delta)
+                    speed = full_speed  # Can pull at full speed on subsequent steps
 
-                    if (step - delta) < self.ENCODER_MIN:
+                    if (step - delta) < min_movement:
                         self.logAlways("No encoder movement despite both steppers are pulling after %d moves" % (i+1))
                         stuck_in_extruder = True
                         break
@@ -2062,13 +2183,13 @@ class Ercf:
             sync = not skip_sync_move and self.sync_unload_length > 0
             initial_move = 10. if not sync else self.sync_unload_length
             if sync:
-                self.logAlways("Moving the gear and extruder motors in sync for %.1fmm" % -initial_move)
+                self.logDebug("Moving the gear and extruder motors in sync for %.1fmm", -initial_move)
                 delta = self._trace_filament_move("Sync unload", -initial_move, speed=self.sync_unload_speed, motor="both")
-                self.logAlways("Motor moved, delta %.1f" % delta)
+                self.logDebug("Motor moved, delta %.1f", delta)
             else:
-                self.logAlways("Moving the gear motor for %.1fmm" % -initial_move)
+                self.logDebug("Moving the gear motor for %.1fmm", -initial_move)
                 delta = self._trace_filament_move("Unload", -initial_move, speed=self.sync_unload_speed, motor="gear")
-                self.logAlways("Motor moved, delta %.1f" % delta)
+                self.logDebug("Motor moved, delta %.1f", delta)
 
             if delta > max(initial_move * 0.5, 1): # 50% slippage
                 self.logAlways("Error unloading filament - not enough detected at encoder. Suspect servo not properly down. Retrying...")
@@ -2086,15 +2207,15 @@ class Ercf:
 
         # Continue fast unload
         moves = 1 if length < (self.getCalibrationReference() / self.num_moves) else self.num_moves
+        move_length = length / moves
         delta = 0
+        self._set_loaded_status(self.LOADED_STATUS_PARTIAL_IN_BOWDEN)
         for i in range(moves):
             msg = "Course unloading move #%d from bowden" % (i+1)
-            self.logAlways("Doing bowden move, distance: %.1f" % (-length / moves))
-            localDelta = self._trace_filament_move(msg, -length / moves)
+            self.logDebug("Doing bowden move, distance: %.1f", -move_length)
+            localDelta = self._trace_filament_move(msg, -move_length)
             delta += localDelta
-            self.logAlways("Motors moved, distance: %.1f" % localDelta)
-            if i < moves:
-                self._set_loaded_status(self.LOADED_STATUS_PARTIAL_IN_BOWDEN)
+            self.logDebug("Motors moved, distance: %.1f", localDelta)
         if delta >= length * 0.8 and not self.calibrating: # 80% slippage detects filament still stuck in extruder
             raise ErcfError("Failure to unload bowden. Perhaps filament is stuck in extruder. Gear moved %.1fmm, Encoder delta %.1fmm" % (length, delta))
         elif delta >= tolerance and not self.calibrating:
@@ -2110,16 +2231,16 @@ class Ercf:
         self.servoDown()
         for i in range(max_steps):
             msg = "Unloading step #%d from encoder" % (i+1)
-            self.logAlways("Doing encoder move, distance: %.1f" % -self.encoder_move_step_size)
+            self.logDebug("Doing encoder move, distance: %.1f", -self.encoder_move_step_size)
             delta = self._trace_filament_move(msg, -self.encoder_move_step_size)
-            self.logAlways("Motor moved, delta: %.1f" % delta)
+            self.logDebug("Motor moved, delta: %.1f", delta)
             # Large enough delta here means we are out of the encoder
             if delta >= self.encoder_move_step_size * 0.2: # 20 %
                 self._set_loaded_status(self.LOADED_STATUS_PARTIAL_BEFORE_ENCODER)
                 park = self.parking_distance - delta# will be between 8 and 20mm (for 23mm parking_distance, 15mm step)
-                self.logAlways("Doing final parking move, distance: %.1f" % -park)
+                self.logDebug("Doing final parking move, distance: %.1f", -park)
                 delta = self._trace_filament_move("Final parking", -park)
-                self.logAlways("Motor moved, delta: %.1f" % delta)
+                self.logDebug("Motor moved, delta: %.1f", delta)
                 # We don't expect any movement of the encoder unless it is free-spinning
                 if park - delta > 1.0: # We expect 0, but relax the test a little
                     self.logInfo("Warning: Possible encoder malfunction (free-spinning) during final filament parking")
@@ -2150,7 +2271,7 @@ class Ercf:
             self.gcode.run_script_from_command("_ERCF_FORM_TIP_STANDALONE")
             self.gcode.run_script_from_command("SET_PRESSURE_ADVANCE ADVANCE=%.4f" % initial_pa) # Restore PA
             delta = self.encoder_sensor.get_distance() - initial_encoder_position
-            self.logTrace("After tip formation, encoder moved %.2f" % delta)
+            self.logTrace("After tip formation, encoder moved %.2f", delta)
             self.encoder_sensor.set_distance(initial_encoder_position + park_pos)
 
             if self.extruder_tmc and self.extruder_form_tip_current > 100:
@@ -2202,8 +2323,8 @@ class Ercf:
         self.is_homed = False
         self.gate_selected = self.TOOL_UNKNOWN
         self.servoUp()
-        num_channels = len(self.selector_offsets)
-        selector_length = 10. + (num_channels-1)*self.filamentblock_width + ((num_channels-1)//3)*5. + 30
+        num_channels = self._num_gates
+        selector_length = self.selector_move_lengths[-1]
         self.logDebug("Moving up to %.1fmm to home a %d channel ERCF" % (selector_length, num_channels))
         self.toolhead.wait_moves()
         if self.sensorless_selector == 1:
@@ -2238,7 +2359,7 @@ class Ercf:
                 self.logInfo("Selector is blocked by inside filament, trying to recover...")
                 # Realign selector
                 self.selector_stepper.do_set_position(0.)
-                self.logTrace("Resetting selector by a distance of: %.1fmm" % -travel)
+                self.logTrace("Resetting selector by a distance of: %.1fmm", -travel)
                 self._selector_stepper_move_wait(-travel)
 
                 # See if we can detect filament in the encoder
@@ -2273,22 +2394,25 @@ class Ercf:
                 raise ErcfError("Selector path is probably externally blocked")
 
     def _attempt_selector_move(self, target):
-        self.logTrace("Attempting to move selector. Target move: %d" % target)
-        selector_steps = self.selector_stepper.steppers[0].get_step_dist()
+        self.logTrace("Attempting to move selector. Target move: %d", target)
+        selector_mcu_stepper = self._selector_mcu_stepper
         init_position = self.selector_stepper.get_position()[0]
-        init_mcu_pos = self.selector_stepper.steppers[0].get_mcu_position()
+        init_mcu_pos = selector_mcu_stepper.get_mcu_position()
         target_move = target - init_position
         self._selector_stepper_move_wait(target, homing_move=2)
-        mcu_position = self.selector_stepper.steppers[0].get_mcu_position()
-        travel = (mcu_position - init_mcu_pos) * selector_steps
+        mcu_position = selector_mcu_stepper.get_mcu_position()
+        travel = (mcu_position - init_mcu_pos) * self._selector_step_dist
         delta = abs(target_move - travel)
-        self.logTrace("Selector moved %.1fmm of intended travel from: %.1fmm to: %.1fmm (delta: %.1fmm)"
-                        % (travel, init_position, target, delta))
+        self.logTrace("Selector moved %.1fmm of intended travel from: %.1fmm to: %.1fmm (delta: %.1fmm)",
+                        travel, init_position, target, delta)
         if delta <= 1.7 : # stupid magic bullshit constant
-            # True up position
-            self.logTrace("Truing selector %.1fmm to %.1fmm" % (delta, target))
-            self.selector_stepper.do_set_position(init_position + travel)
-            self._selector_stepper_move_wait(target)
+            # True up position, no correction move if we are already within a step of the target
+            if delta < self._selector_step_dist:
+                self.selector_stepper.do_set_position(target)
+            else:
+                self.logTrace("Truing selector %.1fmm to %.1fmm", delta, target)
+                self.selector_stepper.do_set_position(init_position + travel)
+                self._selector_stepper_move_wait(target)
             return True, travel
         else:
             return False, travel
@@ -2311,13 +2435,13 @@ class Ercf:
             m117_msg = ("%s > T%d" % (initial_tool_string, tool))
         # Important to always inform user in case there is an error and manual recovery is necessary
         self._last_toolchange = m117_msg
-        self.gcode.run_script_from_command("M117 %s" % m117_msg)
+        self._m117(m117_msg)
         self.logAlways(msg)
 
         # Check TTG map. We might be mapped to same gate
         if self.tool_to_gate_map[tool] == self.gate_selected and self.loaded_status == self.LOADED_STATUS_FULL:
             self._select_tool(tool)
-            self.gcode.run_script_from_command("M117 T%s" % tool)
+            self._m117("T%d" % tool)
             return
 
         # Identify the start up use case and make it easy for user
@@ -2329,14 +2453,18 @@ class Ercf:
         if not skip_unload:
             self._unload_tool(skip_tip=skip_tip)
         self._select_and_load_tool(tool)
-        self.gcode.run_script_from_command("M117 T%s" % tool)
+        self._m117("T%d" % tool)
+
+    # Not deduplicated because other macros may have written to the display in between
+    def _m117(self, msg):
+        self.gcode.run_script_from_command("M117 " + msg)
 
     def _unselect_tool(self):
         self.servoUp()
         self._set_tool_selected(self.TOOL_UNKNOWN, silent=True)
 
     def _select_tool(self, tool, move_servo=True):
-        if tool < 0 or tool >= len(self.selector_offsets):
+        if tool < 0 or tool >= self._num_gates:
             self.logAlways("Tool %d does not exist" % tool)
             return
 
@@ -2346,8 +2474,12 @@ class Ercf:
             return
 
         self.logDebug("Selecting tool T%d on gate #%d..." % (tool, gate))
-        self._select_gate(gate)
-        self._set_tool_selected(tool, silent=True)
+        deferred = self._set_defer_saves(True) # Save gate and tool together
+        try:
+            self._select_gate(gate)
+            self._set_tool_selected(tool, silent=True)
+        finally:
+            self._set_defer_saves(deferred)
 #        if move_servo:
 #            self.servoUp()
         self.logInfo("Tool T%d enabled%s" % (tool, (" on gate #%d" % gate) if tool != gate else ""))
@@ -2368,11 +2500,11 @@ class Ercf:
 
     def _set_gate_selected(self, gate):
         self.gate_selected = gate
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_GATE_SELECTED, self.gate_selected))
+        self._save_vars([(self.VARS_ERCF_GATE_SELECTED, gate)])
 
     def _set_tool_selected(self, tool, silent=False):
         self.tool_selected = tool
-        self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_ERCF_TOOL_SELECTED, self.tool_selected))
+        self._save_vars([(self.VARS_ERCF_TOOL_SELECTED, tool)])
         if tool == self.TOOL_UNKNOWN:
             self._set_steps(1.)
         else:
@@ -2381,15 +2513,10 @@ class Ercf:
 
     # Note that rotational steps are set in the above tool selection or calibration functions
     def _set_steps(self, ratio=1.):
-        self.logTrace("Setting ERCF gear motor step ratio to %.6f" % ratio)
-        new_step_dist = self.ref_step_dist / ratio
-        stepper = self.gear_stepper.steppers[0]
-        if hasattr(stepper, "set_rotation_distance"):
-            new_rotation_dist = new_step_dist * stepper.get_rotation_distance()[1]
-            stepper.set_rotation_distance(new_rotation_dist)
-        else:
-            # Backwards compatibility for old klipper versions
-            stepper.set_step_dist(new_step_dist)
+        if ratio == self._applied_gear_ratio: return # Avoid needless stepper reconfiguration
+        self._applied_gear_ratio = ratio
+        self.logTrace("Setting ERCF gear motor step ratio to %.6f", ratio)
+        self._apply_gear_step_dist(self.ref_step_dist / ratio)
 
 
 ### CORE GCODE COMMANDS ##########################################################
@@ -2407,7 +2534,7 @@ class Ercf:
     cmd_ERCF_HOME_help = "Home the ERCF"
     def cmd_ERCF_HOME(self, gcmd):
         if self._check_is_disabled(): return
-        tool = gcmd.get_int('TOOL', 0, minval=0, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', 0, minval=0, maxval=self._num_gates-1)
         force_unload = gcmd.get_int('FORCE_UNLOAD', -1, minval=0, maxval=1)
         try:
             self._home(tool, force_unload)
@@ -2420,8 +2547,8 @@ class Ercf:
         if self._check_is_paused(): return
         if self._check_not_homed(): return
         if self._check_is_loaded(): return
-        tool = gcmd.get_int('TOOL', -1, minval=0, maxval=len(self.selector_offsets)-1)
-        gate = gcmd.get_int('GATE', -1, minval=0, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', -1, minval=0, maxval=self._num_gates-1)
+        gate = gcmd.get_int('GATE', -1, minval=0, maxval=self._num_gates-1)
         if tool == -1 and gate == -1:
             raise gcmd.error("Error on 'ERCF_SELECT': missing TOOL or GATE")
         try:
@@ -2434,14 +2561,11 @@ class Ercf:
                 if self.tool_selected >= 0 and self.tool_to_gate_map[self.tool_selected] == gate:
                     pass
                 else:
-                    tool_found = False
-                    for tool in range(len(self.tool_to_gate_map)):
-                        if self.tool_to_gate_map[tool] == gate:
-                            self._select_tool(tool)
-                            tool_found = True
-                            break
-                    if not tool_found:
+                    tool = self._gate_to_first_tool[gate]
+                    if tool < 0:
                         self._set_tool_selected(self.TOOL_UNKNOWN, silent=True)
+                    else:
+                        self._select_tool(tool)
         except ErcfError as ee:
             self._pause(str(ee))
 
@@ -2449,7 +2573,7 @@ class Ercf:
     def cmd_ERCF_CHANGE_TOOL(self, gcmd):
         if self._check_is_disabled(): return
         if self._check_is_paused(): return
-        tool = gcmd.get_int('TOOL', minval=0, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', minval=0, maxval=self._num_gates-1)
         standalone = bool(gcmd.get_int('STANDALONE', 0, minval=0, maxval=1))
         skip_tip = self._is_in_print() and not standalone
         if self.loaded_status == self.LOADED_STATUS_UNKNOWN and self.is_homed: # Will be done later if not homed
@@ -2563,8 +2687,8 @@ class Ercf:
     def cmd_ERCF_RECOVER(self, gcmd):
         if self._check_is_disabled(): return
         if self._check_is_paused(): return
-        tool = gcmd.get_int('TOOL', self.TOOL_UNKNOWN, minval=-2, maxval=len(self.selector_offsets)-1)
-        mod_gate = gcmd.get_int('GATE', self.TOOL_UNKNOWN, minval=-2, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', self.TOOL_UNKNOWN, minval=-2, maxval=self._num_gates-1)
+        mod_gate = gcmd.get_int('GATE', self.TOOL_UNKNOWN, minval=-2, maxval=self._num_gates-1)
         loaded = gcmd.get_int('LOADED', -1, minval=0, maxval=1)
 
         if tool >= 0: # If tool is specified then use and optionally override the gate
@@ -2601,11 +2725,12 @@ class Ercf:
         loops = gcmd.get_int('LOOP', 100)
         servo = gcmd.get_int('SERVO', 0)
         try:
+            # Random tool and occasional (1 in 11) homing for every loop
+            schedule = [(randint(0, self._num_gates-1), randint(0, 10) == 0) for l in range(loops)]
             self._home()
-            for l in range(loops):
+            for l, (tool, home) in enumerate(schedule):
                 self.logAlways("Testing loop %d / %d" % (l, loops))
-                tool = randint(0, len(self.selector_offsets))
-                if randint(0, 10) == 0:
+                if home:
                     self._home(tool)
                 else:
                     self._select_tool(tool)
@@ -2626,15 +2751,15 @@ class Ercf:
         try:
             for l in range(loops):
                 self.logAlways("Testing loop %d / %d" % (l, loops))
-                for t in range(len(self.selector_offsets)):
+                for t in range(self._num_gates):
                     tool = t
                     if random == 1:
-                        tool = randint(0, len(self.selector_offsets)-1)
+                        tool = randint(0, self._num_gates-1)
                     gate = self.tool_to_gate_map[tool]
                     if self.gate_status[gate] == self.GATE_EMPTY:
-                        self.logAlways("Skipping tool %d of %d because gate %d is empty" % (tool, len(self.selector_offsets), gate))
+                        self.logAlways("Skipping tool %d of %d because gate %d is empty" % (tool, self._num_gates, gate))
                     else:
-                        self.logAlways("Testing tool %d of %d (gate %d)" % (tool, len(self.selector_offsets), gate))
+                        self.logAlways("Testing tool %d of %d (gate %d)" % (tool, self._num_gates, gate))
                         if not to_nozzle:
                             self._select_tool(tool)
                             self._load_sequence(100, no_extruder=True)
@@ -2690,15 +2815,17 @@ class Ercf:
         step = gcmd.get_float('STEP', 1, minval=0.5, maxval=20)
         sensitivity = gcmd.get_float('SENSITIVITY', self.DEFAULT_ENCODER_RESOLUTION, minval=0.1, maxval=10)
         if direction == 0: return
+        lines = []
         try:
             if not self._is_filament_in_bowden():
                 # Ready ERCF for test if not already setup
                 self._unload_tool()
                 self._load_sequence(100 if direction == 1 else 200, no_extruder=True)
             self.encoder_sensor.reset_counts()    # Encoder 0000
+            move = direction * step
             for i in range(1, int(100 / step)):
-                self._trace_filament_move("Test move", direction * step)
-                measured = self.encoder_sensor.get_distance()
+                self._trace_filament_move("Test move", move)
+                measured = self._encoder_distance()
                 moved = i * step
                 drift = int(round((moved - measured) / sensitivity))
                 if drift > 0:
@@ -2707,9 +2834,17 @@ class Ercf:
                     drift_str = "--------!!"[0:-drift]
                 else:
                     drift_str = ""
-                self.logInfo("Gear/Encoder : %05.2f / %05.2f mm %s" % (moved, measured, drift_str))
+                lines.append("Gear/Encoder : %05.2f / %05.2f mm %s" % (moved, measured, drift_str))
+                if len(lines) == 10: # Flush in batches so progress is still visible
+                    self.logInfo("\n".join(lines))
+                    lines.clear()
+            if lines:
+                self.logInfo("\n".join(lines))
+                lines.clear()
             self._unload_tool()
         except ErcfError as ee:
+            if lines:
+                self.logInfo("\n".join(lines))
             self.logAlways("Tracking test failed: %s" % str(ee))
 
     cmd_ERCF_TEST_UNLOAD_help = "For testing for fine control of filament unloading and parking it in the ERCF"
@@ -2744,91 +2879,25 @@ class Ercf:
 
     cmd_ERCF_TEST_CONFIG_help = "Runtime adjustment of ERCF configuration for testing or in-print tweaking purposes"
     def cmd_ERCF_TEST_CONFIG(self, gcmd):
-        self.long_moves_speed = gcmd.get_float('LONG_MOVES_SPEED', self.long_moves_speed, above=20.)
-        self.long_moves_speed_from_spool = gcmd.get_float('LONG_MOVES_SPEED_FROM_SPOOL', self.long_moves_speed_from_spool, above=20.)
-        self.short_moves_speed = gcmd.get_float('SHORT_MOVES_SPEED', self.short_moves_speed, above=20.)
-        self.home_to_extruder = gcmd.get_int('HOME_TO_EXTRUDER', self.home_to_extruder, minval=0, maxval=1)
-        self.ignore_extruder_load_error = gcmd.get_int('IGNORE_EXTRUDER_LOAD_ERROR', self.ignore_extruder_load_error, minval=0, maxval=1)
-        self.extruder_homing_max = gcmd.get_float('EXTRUDER_HOMING_MAX', self.extruder_homing_max, above=20.)
-        self.extruder_homing_step = gcmd.get_float('EXTRUDER_HOMING_STEP', self.extruder_homing_step, minval=1., maxval=5.)
-        self.toolhead_homing_max = gcmd.get_float('TOOLHEAD_HOMING_MAX', self.toolhead_homing_max, minval=0.)
-        self.toolhead_homing_step = gcmd.get_float('TOOLHEAD_HOMING_STEP', self.toolhead_homing_step, minval=0.5, maxval=5.)
-        self.extruder_homing_current = gcmd.get_int('EXTRUDER_HOMING_CURRENT', self.extruder_homing_current, minval=10, maxval=100)
-        self.extruder_form_tip_current = gcmd.get_int('EXTRUDER_FORM_TIP_CURRENT', self.extruder_form_tip_current, minval=100, maxval=150)
-        self.delay_servo_release = gcmd.get_float('DELAY_SERVO_RELEASE', self.delay_servo_release, minval=0., maxval=5.)
-        self.sync_load_length = gcmd.get_float('SYNC_LOAD_LENGTH', self.sync_load_length, minval=0., maxval=100.)
-        self.sync_load_speed = gcmd.get_float('SYNC_LOAD_SPEED', self.sync_load_speed, minval=1., maxval=100.)
-        self.sync_unload_length = gcmd.get_float('SYNC_UNLOAD_LENGTH', self.sync_unload_length, minval=0., maxval=100.)
-        self.sync_unload_speed = gcmd.get_float('SYNC_UNLOAD_SPEED', self.sync_unload_speed, minval=1., maxval=100.)
-        self.sync_to_extruder = gcmd.get_int('SYNC_TO_EXTRUDER', self.sync_to_extruder, minval=0, maxval=1)
-        self.sync_load_extruder = gcmd.get_int('SYNC_LOAD_EXTRUDER', self.sync_load_extruder, minval=0, maxval=1)
-        self.sync_unload_extruder = gcmd.get_int('SYNC_UNLOAD_EXTRUDER', self.sync_unload_extruder, minval=0, maxval=1)
-        self.sync_form_tip = gcmd.get_int('SYNC_FORM_TIP', self.sync_form_tip, minval=0, maxval=1)
-        self.sync_gear_current = gcmd.get_int('SYNC_GEAR_CURRENT', self.sync_gear_current, minval=10, maxval=100)
-        self.num_moves = gcmd.get_int('NUM_MOVES', self.num_moves, minval=1)
-        self.apply_bowden_correction = gcmd.get_int('APPLY_BOWDEN_CORRECTION', self.apply_bowden_correction, minval=0, maxval=1)
-        self.load_bowden_tolerance = gcmd.get_float('LOAD_BOWDEN_TOLERANCE', self.load_bowden_tolerance, minval=1., maxval=50.)
-
-        self.home_position_to_nozzle = gcmd.get_float('HOME_POSITION_TO_NOZZLE', self.home_position_to_nozzle, minval=5.)
-        self.extruder_to_nozzle = gcmd.get_float('EXTRUDER_TO_NOZZLE', self.extruder_to_nozzle, minval=0.)
-        self.sensor_to_nozzle = gcmd.get_float('SENSOR_TO_NOZZLE', self.sensor_to_nozzle, minval=0.)
-
-        self.nozzle_load_speed = gcmd.get_float('NOZZLE_LOAD_SPEED', self.nozzle_load_speed, minval=1., maxval=100.)
-        self.nozzle_unload_speed = gcmd.get_float('NOZZLE_UNLOAD_SPEED', self.nozzle_unload_speed, minval=1., maxval=100)
-        self.z_hop_height = gcmd.get_float('Z_HOP_HEIGHT', self.z_hop_height, minval=0.)
-        self.z_hop_speed = gcmd.get_float('Z_HOP_SPEED', self.z_hop_speed, minval=1.)
-        self.logLevel = gcmd.get_int('logLevel', self.logLevel, minval=0, maxval=4)
-        self.logVisual = gcmd.get_int('logVisual', self.logVisual, minval=0, maxval=2)
-        self.enable_clog_detection = gcmd.get_int('ENABLE_CLOG_DETECTION', self.enable_clog_detection, minval=0, maxval=2)
+        for option, getter, limits in self.TEST_CONFIG_PARAMETERS:
+            setattr(self, option, getattr(gcmd, getter)(option.upper(), getattr(self, option), **limits))
         self.encoder_sensor.set_mode(self.enable_clog_detection)
-        self.enable_endless_spool = gcmd.get_int('ENABLE_ENDLESS_SPOOL', self.enable_endless_spool, minval=0, maxval=1)
         self.variables[self.VARS_ERCF_CALIB_REF] = gcmd.get_float('ERCF_CALIB_REF', self.getCalibrationReference(), minval=10.)
         clog_length = gcmd.get_float('ERCF_CALIB_CLOG_LENGTH', self.encoder_sensor.get_clog_detection_length(), minval=1., maxval=100.)
         if clog_length != self.encoder_sensor.get_clog_detection_length():
             self.encoder_sensor.set_clog_detection_length(clog_length)
-        msg = "long_moves_speed = %.1f" % self.long_moves_speed
-        msg = "long_moves_speed_from_spool = %.1f" % self.long_moves_speed_from_spool
-        msg += "\nshort_moves_speed = %.1f" % self.short_moves_speed
-        msg += "\nhome_to_extruder = %d" % self.home_to_extruder
-        msg += "\nignore_extruder_load_error = %d" % self.ignore_extruder_load_error
-        msg += "\nextruder_homing_max = %.1f" % self.extruder_homing_max
-        msg += "\nextruder_homing_step = %.1f" % self.extruder_homing_step
-        msg += "\ntoolhead_homing_max = %.1f" % self.toolhead_homing_max
-        msg += "\ntoolhead_homing_step = %.1f" % self.toolhead_homing_step
-        msg += "\nextruder_homing_current = %d" % self.extruder_homing_current
-        msg += "\nextruder_form_tip_current = %d" % self.extruder_form_tip_current
-        msg += "\ndelay_servo_release = %.1f" % self.delay_servo_release
-        msg += "\nsync_load_length = %.1f" % self.sync_load_length
-        msg += "\nsync_load_speed = %.1f" % self.sync_load_speed
-        msg += "\nsync_unload_length = %.1f" % self.sync_unload_length
-        msg += "\nsync_unload_speed = %.1f" % self.sync_unload_speed
-        msg += "\nsync_to_extruder = %d" % self.sync_to_extruder
-        msg += "\nsync_load_extruder = %d" % self.sync_load_extruder
-        msg += "\nsync_unload_extruder = %d" % self.sync_unload_extruder
-        msg += "\nsync_form_tip = %d" % self.sync_form_tip
-        msg += "\nsync_gear_current = %d" % self.sync_gear_current
-        msg += "\nnum_moves = %d" % self.num_moves
-        msg += "\napply_bowden_correction = %d" % self.apply_bowden_correction
-        msg += "\nload_bowden_tolerance = %d" % self.load_bowden_tolerance
-
-        # home_position_to_nozzle is generic, extruder_to_nozzle specific to sensorless, sensor_to_nozzle specific to toolhead sensor
-        msg += "\nhome_position_to_nozzle = %.1f" % self.home_position_to_nozzle
-        if self.extruder_to_nozzle > 0.:
-            msg += "\nextruder_to_nozzle = %.1f" % self.extruder_to_nozzle
-        if self.sensor_to_nozzle > 0.:
-            msg += "\nsensor_to_nozzle = %.1f" % self.sensor_to_nozzle
-
-        msg += "\nnozzle_load_speed = %.1f" % self.nozzle_load_speed
-        msg += "\nnozzle_unload_speed = %.1f" % self.nozzle_unload_speed
-        msg += "\nz_hop_height = %.1f" % self.z_hop_height
-        msg += "\nz_hop_speed = %.1f" % self.z_hop_speed
-        msg += "\nlogLevel = %d" % self.logLevel
-        msg += "\nlogVisual = %d" % self.logVisual
-        msg += "\nenable_clog_detection = %d" % self.enable_clog_detection
-        msg += "\nenable_endless_spool = %d" % self.enable_endless_spool
-        msg += "\nercf_calib_ref = %.1f" % self.variables[self.VARS_ERCF_CALIB_REF]
-        msg += "\nercf_calib_clog_length = %.1f" % clog_length
-        self.logInfo(msg)
+
+        if self.logLevel < 1: return # Summary would not be displayed
+        msg = []
+        for option, getter, limits in self.TEST_CONFIG_PARAMETERS:
+            value = getattr(self, option)
+            # extruder_to_nozzle is specific to sensorless, sensor_to_nozzle specific to toolhead sensor
+            if option in ('extruder_to_nozzle', 'sensor_to_nozzle') and value <= 0.:
+                continue
+            msg.append(("%s = %.1f" if getter == 'get_float' else "%s = %d") % (option, value))
+        msg.append("ercf_calib_ref = %.1f" % self.variables[self.VARS_ERCF_CALIB_REF])
+        msg.append("ercf_calib_clog_length = %.1f" % clog_length)
+        self.logInfo("\n".join(msg))
 
 
 ###########################################
@@ -2840,11 +2909,11 @@ class Ercf:
         if self.tool_selected < 0:
             raise ErcfError("Filament runout or clog on an unknown - manual intervention is required")
 
-        self.logInfo("Issue on tool T%d" % self.tool_selected)
+        self.logInfo("Issue on tool T%d", self.tool_selected)
         self._save_toolhead_position_and_lift()
 
         # Check for clog by looking for filament in the encoder
-        self.logDebug("Checking if this is a clog or a runout (state %d)..." % self.loaded_status)
+        self.logDebug("Checking if this is a clog or a runout (state %d)...", self.loaded_status)
         self.servoDown()
         found = self._buzz_gear_motor()
         self.servoUp()
@@ -2857,23 +2926,19 @@ class Ercf:
         self.logAlways("A runout has been detected")
         if self.enable_endless_spool:
             group = self.endless_spool_groups[self.gate_selected]
-            self.logInfo("EndlessSpool checking for additional spools in group %d..." % group)
-            num_gates = len(self.selector_offsets)
+            self.logInfo("EndlessSpool checking for additional spools in group %d...", group)
             self._set_gate_status(self.gate_selected, self.GATE_EMPTY) # Indicate current gate is empty
-            next_gate = -1
-            checked_gates = []
-            for i in range(num_gates - 1):
-                check = (self.gate_selected + i + 1) % num_gates
-                if self.endless_spool_groups[check] == group:
-                    checked_gates.append(check)
-                    if self.gate_status[check] != self.GATE_EMPTY:
-                        next_gate = check
-                        break
+            # Other gates in the same group, in order following the current gate
+            groups = self.endless_spool_groups
+            order = list(range(self.gate_selected + 1, self._num_gates)) + list(range(self.gate_selected))
+            group_gates = [gate for gate in order if groups[gate] == group]
+            gate_status = self.gate_status
+            next_gate = next((gate for gate in group_gates if gate_status[gate] != self.GATE_EMPTY), -1)
             if next_gate == -1:
-                self.logInfo("No more available spools found in Group_%d - manual intervention is required" % self.endless_spool_groups[self.tool_selected])
-                self.logInfo(self._tool_to_gate_map_to_human_string())
-                raise ErcfError("No more EndlessSpool spools available after checking gates %s" % checked_gates)
-            self.logInfo("Remapping T%d to gate #%d" % (self.tool_selected, next_gate))
+                self.logInfo("No more available spools found in Group_%d - manual intervention is required", group)
+                self._display_ttg_map()
+                raise ErcfError("No more EndlessSpool spools available after checking gates %s" % group_gates)
+            self.logInfo("Remapping T%d to gate #%d", self.tool_selected, next_gate)
 
             self.gcode.run_script_from_command("_ERCF_ENDLESS_SPOOL_PRE_UNLOAD")
             if not self._form_tip_standalone(disable_sync = True):
@@ -2893,6 +2958,7 @@ class Ercf:
 
     def _set_tool_to_gate(self, tool, gate):
         self.tool_to_gate_map[tool] = gate
+        self._rebuild_gate_index()
         self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map))
 
     def _set_gate_status(self, gate, state):
@@ -2900,104 +2966,120 @@ class Ercf:
         self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_GATE_STATUS, self.gate_status))
 
     def _get_filament_char(self, gate_status, no_space=False):
-        if gate_status == self.GATE_AVAILABLE_FROM_BUFFER:
-            return "B"
-        elif gate_status == self.GATE_AVAILABLE:
-            return "*"
-        elif gate_status == self.GATE_EMPTY:
-            return ("." if no_space else " ")
-        else:
-            return "?"
+        return (self.GATE_CHARS_NO_SPACE if no_space else self.GATE_CHARS).get(gate_status, "?")
+
+    # Map displays are only rendered when info logging would show them
+    def _display_ttg_map(self, summary=False):
+        if self.logLevel > 0:
+            self.logInfo(self._tool_to_gate_map_to_human_string(summary))
+
+    def _display_gate_map(self):
+        if self.logLevel > 0:
+            self.logInfo(self._gate_map_to_human_string())
 
     def _tool_to_gate_map_to_human_string(self, summary=False):
-        msg = ""
+        # Reuse the last rendering if nothing it depends on has changed
+        key = (summary, tuple(self.tool_to_gate_map), tuple(self.gate_status), tuple(self.endless_spool_groups),
+               self.enable_endless_spool, self.tool_selected, self.gate_selected)
+        if self._ttg_string_cache is not None and self._ttg_string_cache[0] == key:
+            return self._ttg_string_cache[1]
+        msg = self._build_tool_to_gate_map_string(summary)
+        self._ttg_string_cache = (key, msg)
+        return msg
+
+    def _build_tool_to_gate_map_string(self, summary):
+        num_gates = self._num_gates
+        ttg_map, gate_status, groups = self.tool_to_gate_map, self.gate_status, self.endless_spool_groups
+        tools_on_gate = [[] for gate in range(num_gates)]
+        for t, gate in enumerate(ttg_map):
+            if 0 <= gate < num_gates:
+                tools_on_gate[gate].append(t)
         if not summary:
-            num_tools = len(self.selector_offsets)
-            for i in range(num_tools): # Tools
-                msg += "\n" if i else ""
-                gate = self.tool_to_gate_map[i]
-                msg += "%s-> Gate #%d%s" % (("T%d " % i)[:3], gate, "(" + self._get_filament_char(self.gate_status[gate]) + ")")
+            group_gates = {} # EndlessSpool group -> gates in ascending order
+            for gate, group in enumerate(groups):
+                group_gates.setdefault(group, []).append(gate)
+            lines = []
+            for i in range(num_gates): # Tools
+                gate = ttg_map[i]
+                line = "%s-> Gate #%d%s" % (("T%d " % i)[:3], gate, "(" + self._get_filament_char(gate_status[gate]) + ")")
                 if self.enable_endless_spool:
-                    group = self.endless_spool_groups[gate]
-                    es = " Group_%s: " % group
-                    prefix = ""
-                    starting_gate = self.tool_to_gate_map[i]
-                    for j in range(num_tools): # Gates
-                        gate = (j + starting_gate) % num_tools
-                        if self.endless_spool_groups[gate] == group:
-                            es += "%s%d%s" % (prefix, gate,self._get_filament_char(self.gate_status[gate]))
-                            prefix = " > "
-                    msg += es
+                    group = groups[gate]
+                    members = group_gates[group]
+                    split = members.index(gate) # Start with the tool's own gate
+                    es_gates = ["%d%s" % (es_gate, self._get_filament_char(gate_status[es_gate])) for es_gate in members[split:] + members[:split]]
+                    line += " Group_%s: %s" % (group, " > ".join(es_gates))
                 if i == self.tool_selected:
-                    msg += " [SELECTED on gate #%d]" % self.gate_selected
-            msg += "\n"
-            for gate in range(len(self.selector_offsets)):
-                msg += "\nGate #%d%s" % (gate, "(" + self._get_filament_char(self.gate_status[gate]) + ")")
-                tool_str = " -> "
-                prefix = ""
-                for t in range(len(self.selector_offsets)):
-                    if self.tool_to_gate_map[t] == gate:
-                        tool_str += "%sT%d" % (prefix, t)
-                        prefix = ","
-                msg += tool_str
-                msg += "?" if prefix == "" else ""
+                    line += " [SELECTED on gate #%d]" % self.gate_selected
+                lines.append(line)
+            lines.append("")
+            for gate in range(num_gates):
+                tools = tools_on_gate[gate]
+                line = "Gate #%d%s -> %s" % (gate, "(" + self._get_filament_char(gate_status[gate]) + ")",
+                                             ",".join("T%d" % t for t in tools) if tools else "?")
                 if gate == self.gate_selected:
-                    msg += " [SELECTED%s]" % ((" supporting tool T%d" % self.tool_selected) if self.tool_selected >= 0 else "")
+                    line += " [SELECTED%s]" % ((" supporting tool T%d" % self.tool_selected) if self.tool_selected >= 0 else "")
+                lines.append(line)
+            return "\n".join(lines)
         else:
             multi_tool = False
-            msg_gates = "Gates: "
-            msg_avail = "Avail: "
-            msg_tools = "Tools: "
-            msg_selct = "Selct: "
-            for g in range(len(self.selector_offsets)):
-                msg_gates += ("|#%d " % g)[:4]
-                msg_avail += "| %s " % self._get_filament_char(self.gate_status[g], True)
-                tool_str = ""
-                prefix = ""
-                for t in range(len(self.selector_offsets)):
-                    if self.tool_to_gate_map[t] == g:
-                        if len(prefix) > 0: multi_tool = True
-                        tool_str += "%sT%d" % (prefix, t)
-                        prefix = "+"
-                if tool_str == "": tool_str = " . "
-                msg_tools += ("|%s " % tool_str)[:4]
+            msg_gates = ["Gates: "]
+            msg_avail = ["Avail: "]
+            msg_tools = ["Tools: "]
+            msg_selct = ["Selct: "]
+            for g in range(num_gates):
+                msg_gates.append(("|#%d " % g)[:4])
+                msg_avail.append("| %s " % self._get_filament_char(gate_status[g], True))
+                tools = tools_on_gate[g]
+                if len(tools) > 1: multi_tool = True
+                tool_str = "+".join("T%d" % t for t in tools) if tools else " . "
+                msg_tools.append(("|%s " % tool_str)[:4])
                 if self.gate_selected == g:
-                    msg_selct += ("| %s " % self._get_filament_char(self.gate_status[g], True))
+                    msg_selct.append("| %s " % self._get_filament_char(gate_status[g], True))
                 else:
-                    msg_selct += "|---" if self.gate_selected != self.GATE_UNKNOWN and self.gate_selected == (g - 1) else "----"
-            msg += msg_gates
-            msg += "|\n"
-            msg += msg_tools
-            msg += "|%s\n" % (" Some gates support multiple tools!" if multi_tool else "")
-            msg += msg_avail
-            msg += "|\n"
-            msg += msg_selct
-            msg += "|" if self.gate_selected == len(self.selector_offsets) - 1 else "-"
-            msg += f" T{self.tool_selected}" if self.tool_selected >= 0 else ""
-        return msg
+                    msg_selct.append("|---" if self.gate_selected != self.GATE_UNKNOWN and self.gate_selected == (g - 1) else "----")
+            msg_gates.append("|\n")
+            msg_tools.append("|%s\n" % (" Some gates support multiple tools!" if multi_tool else ""))
+            msg_avail.append("|\n")
+            msg_selct.append("|" if self.gate_selected == num_gates - 1 else "-")
+            msg_selct.append(f" T{self.tool_selected}" if self.tool_selected >= 0 else "")
+            return "".join(msg_gates + msg_tools + msg_avail + msg_selct)
 
     def _gate_map_to_human_string(self):
-        msg = "ERCF Filaments:\n"
-        num_gates = len(self.selector_offsets)
-        for g in range(num_gates):
-            material = self.gate_material[g] if self.gate_material[g] != "" else "n/a"
-            color = self.gate_color[g] if self.gate_color[g] != "" else "n/a"
-            available = {
-                self.GATE_AVAILABLE_FROM_BUFFER: "Buffered",
-                self.GATE_AVAILABLE: "Available",
-                self.GATE_EMPTY: "Empty",
-                self.GATE_UNKNOWN: "Unknown"
-            }[self.gate_status[g]]
-            msg += ("Gate #%d: Material: %s, Color: %s, Status: %s\n" % (g, material, color, available))
+        # Reuse the last rendering if the gate map hasn't changed
+        key = (tuple(self.gate_status), tuple(self.gate_material), tuple(self.gate_color))
+        if self._gate_map_string_cache is not None and self._gate_map_string_cache[0] == key:
+            return self._gate_map_string_cache[1]
+        msg = ["ERCF Filaments:\n"]
+        gate_material, gate_color, gate_status = self.gate_material, self.gate_color, self.gate_status
+        for g in range(self._num_gates):
+            material = gate_material[g] if gate_material[g] != "" else "n/a"
+            color = gate_color[g] if gate_color[g] != "" else "n/a"
+            available = self.GATE_STATUS_STRINGS[gate_status[g]]
+            msg.append("Gate #%d: Material: %s, Color: %s, Status: %s\n" % (g, material, color, available))
+        msg = "".join(msg)
+        self._gate_map_string_cache = (key, msg)
         return msg
 
+    # Reverse index of the first (lowest) tool mapped to each gate, -1 if none
+    def _rebuild_gate_index(self):
+        gate_to_first_tool = [-1] * self._num_gates
+        for tool, gate in enumerate(self.tool_to_gate_map):
+            if 0 <= gate < self._num_gates and gate_to_first_tool[gate] < 0:
+                gate_to_first_tool[gate] = tool
+        self._gate_to_first_tool = gate_to_first_tool
+
     def _remap_tool(self, tool, gate, available):
-        self._set_tool_to_gate(tool, gate)
-        self._set_gate_status(gate, available)
+        self.tool_to_gate_map[tool] = gate
+        self._rebuild_gate_index()
+        self.gate_status[gate] = available
+        self.gcode.run_script_from_command(
+            "SAVE_VARIABLE VARIABLE=%s VALUE='%s'\n" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map) +
+            "SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_GATE_STATUS, self.gate_status))
 
     def _reset_ttg_mapping(self):
         self.logDebug("Resetting TTG map")
-        self.tool_to_gate_map = self.default_tool_to_gate_map
+        self.tool_to_gate_map = list(self.default_tool_to_gate_map)
+        self._rebuild_gate_index()
         self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map))
         self._unselect_tool()
 
@@ -3033,20 +3115,16 @@ class Ercf:
         if reset == 1:
             self._reset_ttg_mapping()
         elif ttg_map != "":
-            ttg_map = gcmd.get('MAP').split(",")
-            if len(ttg_map) != len(self.selector_offsets):
-                self.logAlways("The number of map values (%d) is not the same as number of gates (%d)" % (len(ttg_map), len(self.selector_offsets)))
+            ttg_map = ttg_map.split(",")
+            if len(ttg_map) != self._num_gates:
+                self.logAlways("The number of map values (%d) is not the same as number of gates (%d)" % (len(ttg_map), self._num_gates))
                 return
-            self.tool_to_gate_map = []
-            for gate in ttg_map:
-                if gate.isdigit():
-                    self.tool_to_gate_map.append(int(gate))
-                else:
-                    self.tool_to_gate_map.append(0)
+            self.tool_to_gate_map = [int(gate) if gate.isdigit() else 0 for gate in ttg_map]
+            self._rebuild_gate_index()
             self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_TOOL_TO_GATE_MAP, self.tool_to_gate_map))
         else:
-            tool = gcmd.get_int('TOOL', -1, minval=0, maxval=len(self.selector_offsets)-1)
-            gate = gcmd.get_int('GATE', minval=0, maxval=len(self.selector_offsets)-1)
+            tool = gcmd.get_int('TOOL', -1, minval=0, maxval=self._num_gates-1)
+            gate = gcmd.get_int('GATE', minval=0, maxval=self._num_gates-1)
             available = gcmd.get_int('AVAILABLE', -1, minval=0, maxval=1)
             if available == -1:
                 available = self.gate_status[gate]
@@ -3055,7 +3133,7 @@ class Ercf:
             else:
                 self._remap_tool(tool, gate, available)
 
-        self.logInfo(self._tool_to_gate_map_to_human_string())
+        self._display_ttg_map()
 
     cmd_ERCF_SET_GATE_MAP_help = "Define the type and color of filaments on each gate"
     def cmd_ERCF_SET_GATE_MAP(self, gcmd):
@@ -3064,20 +3142,21 @@ class Ercf:
         if reset == 1:
             self._reset_gate_map()
         elif dump == 1:
-            self.logInfo(self._gate_map_to_human_string())
+            self._display_gate_map()
             return
         else:
             # Specifying one gate (filament)
-            gate = gcmd.get_int('GATE', minval=0, maxval=len(self.selector_offsets)-1)
-            material = "".join(gcmd.get('MATERIAL').split()).replace('#', '').upper()[:10]
-            color = "".join(gcmd.get('COLOR').split()).replace('#', '').lower()
+            gate = gcmd.get_int('GATE', minval=0, maxval=self._num_gates-1)
+            # split() also removes unicode whitespace such as non-breaking spaces pasted from UIs
+            material = "".join(gcmd.get('MATERIAL').split()).translate(self.GATE_MAP_STRIP_CHARS).upper()[:10]
+            color = "".join(gcmd.get('COLOR').split()).translate(self.GATE_MAP_STRIP_CHARS).lower()
             available = gcmd.get_int('AVAILABLE', self.gate_status[gate], minval=0, maxval=1)
             self.gate_material[gate] = material
             self.gate_color[gate] = color
             self.gate_status[gate] = available
             self._persist_gate_map()
 
-        self.logInfo(self._gate_map_to_human_string())
+        self._display_gate_map()
 
     cmd_ERCF_ENDLESS_SPOOL_help = "Redefine the EndlessSpool groups"
     def cmd_ERCF_ENDLESS_SPOOL(self, gcmd):
@@ -3095,22 +3174,17 @@ class Ercf:
             self.enable_endless_spool = self.default_enable_endless_spool
             self.endless_spool_groups = self.default_endless_spool_groups
         elif dump == 1:
-            self.logInfo(self._tool_to_gate_map_to_human_string())
+            self._display_ttg_map()
             return
         else:
             groups = gcmd.get('GROUPS', ",".join(map(str, self.endless_spool_groups))).split(",")
-            if len(groups) != len(self.selector_offsets):
-                self.logAlways("The number of group values (%d) is not the same as number of gates (%d)" % (len(groups), len(self.selector_offsets)))
+            if len(groups) != self._num_gates:
+                self.logAlways("The number of group values (%d) is not the same as number of gates (%d)" % (len(groups), self._num_gates))
                 return
-            self.endless_spool_groups = []
-            for group in groups:
-                if group.isdigit():
-                    self.endless_spool_groups.append(int(group))
-                else:
-                    self.endless_spool_groups.append(0)
+            self.endless_spool_groups = [int(group) if group.isdigit() else 0 for group in groups]
         self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE='%s'" % (self.VARS_ERCF_ENDLESS_SPOOL_GROUPS, self.endless_spool_groups))
 
-        self.logInfo(self._tool_to_gate_map_to_human_string())
+        self._display_ttg_map()
 
     cmd_ERCF_CHECK_GATES_help = "Automatically inspects gate(s), parks filament and marks availability"
     def cmd_ERCF_CHECK_GATES(self, gcmd):
@@ -3120,21 +3194,22 @@ class Ercf:
 
         # These three parameters are mutually exclusive so we only process one
         tools = gcmd.get('TOOLS', "!")
-        tool = gcmd.get_int('TOOL', -1, minval=0, maxval=len(self.selector_offsets)-1)
-        gate = gcmd.get_int('GATE', -1, minval=0, maxval=len(self.selector_offsets)-1)
+        tool = gcmd.get_int('TOOL', -1, minval=0, maxval=self._num_gates-1)
+        gate = gcmd.get_int('GATE', -1, minval=0, maxval=self._num_gates-1)
         current_action = self._set_action(self.ACTION_CHECKING)
         try:
             tool_selected = self.tool_selected
             gates_tools = []
             if tools != "!":
                 # Tools used in print (may be empty list)
+                if tools.strip() == "":
+                    self.logDebug("No tools to check, assuming default tool is already loaded")
+                    return
                 try:
+                    ttg_map = self.tool_to_gate_map
                     for tool in tools.split(','):
-                        gate = int(self.tool_to_gate_map[int(tool)])
-                        gates_tools.append([gate, int(tool)])
-                    if len(gates_tools) == 0:
-                        self.logDebug("No tools to check, assuming default tool is already loaded")
-                        return
+                        tool = int(tool)
+                        gates_tools.append([int(ttg_map[tool]), tool])
                 except ValueError as ve:
                     msg = "Invalid TOOLS parameter: %s" % tools
                     if self._is_in_print():
@@ -3151,7 +3226,7 @@ class Ercf:
                 gates_tools.append([gate, -1])
             else :
                 # No parameters means all gates
-                for gate in range(len(self.selector_offsets)):
+                for gate in range(self._num_gates):
                     gates_tools.append([gate, -1])
 
             for gate, tool in gates_tools:
@@ -3165,7 +3240,8 @@ class Ercf:
                         self.logInfo("Tool T%d - filament detected. Gate #%d marked available" % (tool, gate))
                     else:
                         self.logInfo("Gate #%d - filament detected. Marked available" % gate)
-                    self._set_gate_status(gate, max(self.gate_status[gate], self.GATE_AVAILABLE))
+                    if self.gate_status[gate] < self.GATE_AVAILABLE: # Don't reset if filament is buffered
+                        self._set_gate_status(gate, self.GATE_AVAILABLE)
                     try:
                         if encoder_moved > self.ENCODER_MIN:
                             self._unload_encoder(self.unload_buffer)
@@ -3200,7 +3276,7 @@ class Ercf:
             except ErcfError as ee:
                 self.logAlways("Failure re-selecting Tool %d: %s" % (tool_selected, str(ee)))
 
-            self.logInfo(self._tool_to_gate_map_to_human_string(summary=True))
+            self._display_ttg_map(summary=True)
         finally:
             self._set_action(current_action)
 
@@ -3209,7 +3285,7 @@ class Ercf:
         if self._check_is_disabled(): return
         if self._check_not_homed(): return
         if self._check_is_loaded(): return
-        gate = gcmd.get_int('GATE', -1, minval=0, maxval=len(self.selector_offsets)-1)
+        gate = gcmd.get_int('GATE', -1, minval=0, maxval=self._num_gates-1)
         current_action = self._set_action(self.ACTION_CHECKING)
         try:
             self.calibrating = True # To suppress visual filament position
@@ -3219,18 +3295,16 @@ class Ercf:
             else:
                 self._select_gate(gate)
             self.encoder_sensor.reset_counts()    # Encoder 0000
+            self.logAlways("Loading...")
             for i in range(5):
-                self.logAlways("Loading...")
-                try:
-                    self._load_encoder(retry=False, servo_up_on_error=False)
+                self.logDebug("Loading attempt %d of 5", i + 1)
+                if self._load_encoder(retry=False, servo_up_on_error=False, raise_on_fail=False) is not None:
                     # Caught the filament, so now park it in the gate
                     self.logAlways("Parking...")
                     self._unload_encoder(self.unload_buffer)
                     self.logAlways("Filament detected and parked in gate #%d" % gate)
                     return
-                except ErcfError as ee:
-                    # Exception just means filament is not loaded yet, so continue
-                    self.logTrace("Exception on encoder load move: %s" % str(ee))
+                # Filament is not loaded yet, so continue
             self._set_gate_status(gate, self.GATE_EMPTY)
             self.logAlways("Filament not detected in gate #%d" % gate)
         except ErcfError as ee: